@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import time
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response
+from starlette.middleware.base import BaseHTTPMiddleware
+from middlewares.error_handler import ErrorHandler
+
+# Per-request cost of the error middleware, measured by calling the ASGI app directly.
+# Run from the repository root: python -m bench.error_handler --requests 20000
+
+class BaseHTTPErrorHandler(BaseHTTPMiddleware):
+
+    async def dispatch(self, request, call_next):
+        try:
+            return await call_next(request)
+        except Exception as e:
+            return JSONResponse(status_code=500, content={'error': str(e)})
+
+def build_app(middleware=None):
+    app = FastAPI()
+    if middleware is not None:
+        app.add_middleware(middleware)
+
+    @app.get("/ping")
+    def ping():
+        return Response(b"pong")
+
+    return app
+
+async def run(app, requests: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/ping", "raw_path": b"/ping", "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80)
+    }
+
+    async def send(message):
+        pass
+
+    async def call():
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # Like a client that stays connected until the response is done
+            await asyncio.Event().wait()
+
+        await app(dict(scope), receive, send)
+
+    for _ in range(200):
+        await call()
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call()
+    return (time.perf_counter() - start) / requests * 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    results = {}
+    for name, middleware in [("none", None), ("BaseHTTPMiddleware", BaseHTTPErrorHandler), ("ASGI", ErrorHandler)]:
+        results[name] = asyncio.run(run(build_app(middleware), args.requests))
+    for name, micros in results.items():
+        print(f"{name:<20} {micros:8.1f} us/request  overhead {micros - results['none']:7.1f} us")
+
+if __name__ == "__main__":
+    main()
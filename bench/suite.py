@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+# Benchmarks the movie, order and user routes of security.app against a seeded database of
+# --size movies. /logout and the user PUT/DELETE routes are left out, they would revoke or
+# remove the account the run logs in with; monitoring, export and import are operator tools.
+# Run from the repository root:
+#   python -m bench.suite --size 1000 --save            records bench/baselines/1000.json
+#   python -m bench.suite --size 1000                   fails when a route got slower
+#   python -m bench.suite --size 100000 --only "GET /movies"
+
+base_dir = os.path.dirname(os.path.realpath(__file__))
+categories = [f"Category{i:02d}" for i in range(20)]
+words = ["space", "heist", "love", "river", "ghost", "robot", "storm", "queen", "city", "winter"]
+credentials = {"username": "bench", "password": "benchpass", "email": "bench@example.com"}
+
+def movie_row(rng):
+    return {
+        "title": f"Movie {rng.randrange(10 ** 8):08d}",
+        "overview": f"A {rng.choice(words)} story about {rng.choice(words)}",
+        "year": rng.randint(1950, 2022),
+        "rating": round(rng.uniform(1, 10), 1),
+        "category": rng.choice(categories)
+    }
+
+def seed(size: int, lines: int, rng) -> None:
+    from sqlalchemy import func, select, insert
+    from config.dabatase import engine
+    from models.movie import Movie as MovieModel
+    from models.order import Order as OrderModel, OrderMovie as OrderMovieModel
+    from models.user import User as UserModel
+    from utils.jwt_manager import get_password_hash
+    with engine.begin() as connection:
+        if connection.execute(select(func.count()).select_from(MovieModel)).scalar() >= size:
+            return
+        print(f"Seeding {size} movies and {max(size // 10, 10)} orders of {lines} lines", file=sys.stderr)
+        for start in range(0, size, 10000):
+            connection.execute(insert(MovieModel), [movie_row(rng) for _ in range(min(10000, size - start))])
+        connection.execute(insert(UserModel), [dict(credentials, password=get_password_hash(credentials["password"]))])
+        id_user = connection.execute(select(UserModel.id).where(UserModel.username == credentials["username"])).scalar()
+        orders = max(size // 10, 10)
+        for start in range(0, orders, 1000):
+            count = min(1000, orders - start)
+            first = connection.execute(select(func.coalesce(func.max(OrderModel.id), 0))).scalar() + 1
+            connection.execute(insert(OrderModel), [{"id": first + i, "user_id": id_user, "date_created": date(2020, 1, 1) + timedelta(days=rng.randrange(1500))} for i in range(count)])
+            connection.execute(insert(OrderMovieModel), [
+                {"order_id": first + i, "movie_id": movie, "quantity": rng.randint(1, 5)}
+                for i in range(count) for movie in rng.sample(range(1, size + 1), min(lines, size))])
+
+def deletable(count: int, id_user: int, rng) -> dict:
+    # Rows for the DELETE routes, one per request they will send
+    from sqlalchemy import insert
+    from config.dabatase import engine
+    from models.movie import Movie as MovieModel
+    from models.order import Order as OrderModel
+    with engine.begin() as connection:
+        movies = connection.execute(insert(MovieModel).returning(MovieModel.id), [movie_row(rng) for _ in range(count)]).scalars().all()
+        orders = connection.execute(insert(OrderModel).returning(OrderModel.id), [{"user_id": id_user, "date_created": date.today()} for _ in range(count)]).scalars().all()
+    return {"movies_to_delete": list(movies), "orders_to_delete": list(orders)}
+
+def scenarios(size: int):
+    orders = max(size // 10, 10)
+    lines = lambda rng, context: [dict(movie_row(rng), id=rng.randint(1, size), quantity=rng.randint(1, 5)) for _ in range(3)]
+    # (name, method, path(rng, context), json body(rng, context), needs the access token)
+    return [
+        ("GET /movies", "GET", lambda rng, context: "/movies?limit=100", None, True),
+        ("GET /movies filtered", "GET", lambda rng, context: f"/movies?category={rng.choice(categories)}&sort=-rating&limit=100", None, True),
+        ("GET /movies/{id}", "GET", lambda rng, context: f"/movies/{rng.randint(1, size)}", None, True),
+        ("GET /movies/category/{category}", "GET", lambda rng, context: f"/movies/category/{rng.choice(categories)}", None, True),
+        ("GET /movies/search", "GET", lambda rng, context: f"/movies/search?q={rng.choice(words)}", None, True),
+        ("GET /movies/top", "GET", lambda rng, context: f"/movies/top?n=10&category={rng.choice(categories)}", None, True),
+        ("GET /movies/facets", "GET", lambda rng, context: "/movies/facets?field=year", None, True),
+        ("GET /movies/changes", "GET", lambda rng, context: f"/movies/changes?since={rng.randint(0, size)}&limit=100", None, True),
+        ("POST /movies", "POST", lambda rng, context: "/movies", lambda rng, context: movie_row(rng), True),
+        ("PUT /movies/{id}", "PUT", lambda rng, context: f"/movies/{rng.randint(1, size)}", lambda rng, context: movie_row(rng), True),
+        ("DELETE /movies/{id}", "DELETE", lambda rng, context: f"/movies/{context['movies_to_delete'].pop()}", None, True),
+        ("GET /orders", "GET", lambda rng, context: "/orders?limit=100", None, False),
+        ("GET /orders/{id}", "GET", lambda rng, context: f"/orders/{rng.randint(1, orders)}?include=movies", None, False),
+        ("GET /orders/movies/{id_order}", "GET", lambda rng, context: f"/orders/movies/{rng.randint(1, orders)}", None, False),
+        ("POST /orders/{id_user}", "POST", lambda rng, context: f"/orders/{context['id_user']}", lines, False),
+        ("PUT /orders/{id}", "PUT", lambda rng, context: f"/orders/{rng.randint(1, orders)}", lines, False),
+        ("DELETE /orders/{id}", "DELETE", lambda rng, context: f"/orders/{context['orders_to_delete'].pop()}", None, False),
+        ("POST /login", "POST", lambda rng, context: "/login", lambda rng, context: {"username": credentials["username"], "password": credentials["password"]}, False),
+        ("POST /refresh", "POST", lambda rng, context: "/refresh", lambda rng, context: {"refresh_token": context["refresh_token"]}, False),
+        ("POST /signup", "POST", lambda rng, context: "/signup", lambda rng, context: {"username": f"bench{rng.randrange(10 ** 9)}", "password": "benchpass", "email": f"bench{rng.randrange(10 ** 9)}@example.com"}, False)
+    ]
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+def run_scenario(client, scenario, context: dict, requests: int, memory_requests: int, rng) -> dict:
+    name, method, path, body, auth = scenario
+    headers = {"Authorization": f"Bearer {context['access_token']}"} if auth else {}
+
+    def call():
+        return client.request(method, path(rng, context), json=body(rng, context) if body else None, headers=headers)
+
+    for _ in range(max(requests // 10, 1)):
+        call()
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        begin = time.perf_counter()
+        response = call()
+        latencies.append(time.perf_counter() - begin)
+        errors += response.status_code >= 400
+    elapsed = time.perf_counter() - start
+    # Separate pass, tracemalloc slows every allocation down
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    for _ in range(memory_requests):
+        call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "rps": requests / elapsed,
+        "peak_kb": peak / 1024,
+        "errors": errors
+    }
+
+def regressions(results: dict, baseline: dict, threshold: float) -> list:
+    found = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if result[metric] > base[metric] * (1 + threshold):
+                found.append(f"{name}: {metric} {base[metric]:.2f} -> {result[metric]:.2f}")
+        # Below 64 KB the peak is mostly allocator noise
+        if result["peak_kb"] > base["peak_kb"] * (1 + threshold) and result["peak_kb"] - base["peak_kb"] > 64:
+            found.append(f"{name}: peak_kb {base['peak_kb']:.0f} -> {result['peak_kb']:.0f}")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1000, help="movies in the seeded database")
+    parser.add_argument("--lines", type=int, default=20, help="movies per seeded order")
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per route")
+    parser.add_argument("--memory-requests", type=int, default=20)
+    parser.add_argument("--only", action="append", help="route name to run, can be repeated")
+    parser.add_argument("--baseline", help="defaults to bench/baselines/<size>.json")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 is 25%%")
+    parser.add_argument("--save", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # Settings are read when config.dabatase is imported, so they go in before the app
+    os.makedirs(os.path.join(base_dir, "data"), exist_ok=True)
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(base_dir, 'data', f'bench-{args.size}.sqlite')}")
+    os.environ.setdefault("DB_PROFILE", "production")
+    from fastapi.testclient import TestClient
+    from security import app
+    from config.dabatase import Session
+    from services.user import UserService
+
+    rng = random.Random(args.seed)
+    seed(args.size, args.lines, rng)
+    client = TestClient(app)
+    tokens = client.post("/login", json={"username": credentials["username"], "password": credentials["password"]}).json()
+    with Session() as db:
+        context = dict(tokens, id_user=UserService(db).get_user_by_username(credentials["username"]).id)
+    context.update(deletable(max(args.requests // 10, 1) + args.requests + args.memory_requests, context["id_user"], rng))
+
+    results = {}
+    for scenario in scenarios(args.size):
+        if args.only and scenario[0] not in args.only:
+            continue
+        results[scenario[0]] = run_scenario(client, scenario, context, args.requests, args.memory_requests, rng)
+        result = results[scenario[0]]
+        print(f"{scenario[0]:<34} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+              f"{result['rps']:8.1f} req/s  peak {result['peak_kb']:9.0f} KB  errors {result['errors']}")
+
+    baseline_path = args.baseline or os.path.join(base_dir, "baselines", f"{args.size}.json")
+    if args.save:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print(f"Baseline saved to {baseline_path}")
+        return
+    if not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path}, run with --save first")
+        return
+    with open(baseline_path) as file:
+        found = regressions(results, json.load(file), args.threshold)
+    for line in found:
+        print("REGRESSION " + line)
+    sys.exit(1 if found else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,98 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm.session import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
 sqlite_file_name = "../database.sqlite"
 base_dir = os.path.dirname(os.path.realpath(__file__))
 
-database_url = f"sqlite:///{os.path.join(base_dir, sqlite_file_name)}"
+database_url = os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(base_dir, sqlite_file_name)}")
 
-engine = create_engine(database_url, echo=True)
+profiles = {
+    "development": {
+        "echo": True,
+        "pragmas": {"busy_timeout": 5000}
+    },
+    "production": {
+        "echo": False,
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "busy_timeout": 5000,
+            "cache_size": -64000,
+            "mmap_size": 268435456,
+            "temp_store": "MEMORY"
+        }
+    }
+}
+profile = profiles[os.getenv("DB_PROFILE", "development")]
+
+def pool_options(url: str):
+    # In-memory SQLite uses a single-connection pool that takes no sizing
+    if make_url(url).database in (None, "", ":memory:"):
+        return {}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": True
+    }
+
+def configure_sqlite(engine, pragmas: dict):
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        # Take the write lock when the implicit transaction starts, so a
+        # busy writer waits for busy_timeout instead of failing on upgrade
+        dbapi_connection.isolation_level = "IMMEDIATE"
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+engine = create_engine(database_url, echo=profile["echo"], **pool_options(database_url))
+
+async_database_url = os.getenv("ASYNC_DATABASE_URL", database_url.replace("sqlite://", "sqlite+aiosqlite://", 1))
+
+# aiosqlite runs every connection on its own non-daemon thread, so pooled
+# connections would keep the process alive; SQLite connects cheaply anyway
+async_engine = create_async_engine(async_database_url, echo=profile["echo"], poolclass=NullPool)
+
+if engine.dialect.name == "sqlite":
+    configure_sqlite(engine, profile["pragmas"])
+    configure_sqlite(async_engine.sync_engine, profile["pragmas"])
 
 Session = sessionmaker(bind=engine)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
 Base = declarative_base()
 
+def get_db():
+    db = Session()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
+
+def get_pool_stats():
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"status": pool.status()}
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow()
+    }
@@ -0,0 +1,78 @@
+from sqlalchemy import inspect, text
+from config.dabatase import Base
+
+# Columns added after the first release; create_all() does not alter
+# existing tables, so older database.sqlite files get them here
+added_columns = [
+    ("users", "token_version", "INTEGER NOT NULL DEFAULT 0"),
+    ("movies", "version", "INTEGER NOT NULL DEFAULT 1"),
+    ("movies", "updated_at", "DATETIME"),
+    ("orders", "version", "INTEGER NOT NULL DEFAULT 1"),
+    ("orders", "updated_at", "DATETIME"),
+]
+
+# Full-text index over movies, kept in sync by triggers (external content table)
+search_statements = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(title, overview, content='movies', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS movies_fts_insert AFTER INSERT ON movies BEGIN
+        INSERT INTO movies_fts(rowid, title, overview) VALUES (new.id, new.title, new.overview);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS movies_fts_delete AFTER DELETE ON movies BEGIN
+        INSERT INTO movies_fts(movies_fts, rowid, title, overview) VALUES ('delete', old.id, old.title, old.overview);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS movies_fts_update AFTER UPDATE OF title, overview ON movies BEGIN
+        INSERT INTO movies_fts(movies_fts, rowid, title, overview) VALUES ('delete', old.id, old.title, old.overview);
+        INSERT INTO movies_fts(rowid, title, overview) VALUES (new.id, new.title, new.overview);
+    END""",
+]
+
+# One counter per table, bumped by triggers on every row change so a list
+# ETag is a primary key lookup whichever worker or statement did the write
+revision_statements = [
+    "CREATE TABLE IF NOT EXISTS table_revisions (name VARCHAR PRIMARY KEY, revision INTEGER NOT NULL, updated_at DATETIME)",
+    "INSERT OR IGNORE INTO table_revisions (name, revision, updated_at) VALUES ('movies', 0, CURRENT_TIMESTAMP)",
+] + [
+    f"""CREATE TRIGGER IF NOT EXISTS movies_revision_{event.lower()} AFTER {event} ON movies BEGIN
+        UPDATE table_revisions SET revision = revision + 1, updated_at = CURRENT_TIMESTAMP WHERE name = 'movies';
+    END"""
+    for event in ("INSERT", "UPDATE", "DELETE")
+]
+
+# Change feed of movies, deletes leave a tombstone
+change_statements = [
+    f"""CREATE TRIGGER IF NOT EXISTS movie_changes_{event.lower()} AFTER {event} ON movies BEGIN
+        INSERT INTO movie_changes (movie_id, deleted, changed_at) VALUES ({row}.id, {deleted}, CURRENT_TIMESTAMP);
+    END"""
+    for event, row, deleted in (("INSERT", "new", 0), ("UPDATE", "new", 0), ("DELETE", "old", 1))
+]
+
+def migrate(engine):
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        tables = inspector.get_table_names()
+        for table, column, definition in added_columns:
+            if table not in tables:
+                continue
+            columns = [i["name"] for i in inspector.get_columns(table)]
+            if column not in columns:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+        # Indexes declared on the models after their table already existed
+        for table in Base.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        if engine.dialect.name == "sqlite" and "movies" in tables and "movies_fts" not in tables:
+            for statement in search_statements:
+                connection.execute(text(statement))
+            # Index the rows that existed before the search table
+            connection.execute(text("INSERT INTO movies_fts(movies_fts) VALUES ('rebuild')"))
+        if engine.dialect.name == "sqlite" and "movies" in tables:
+            for statement in revision_statements:
+                connection.execute(text(statement))
+            triggers = connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).scalars().all()
+            if "movie_changes" in tables and "movie_changes_insert" not in triggers:
+                # Movies from before the feed existed are its first entries
+                connection.execute(text("INSERT INTO movie_changes (movie_id, deleted, changed_at) SELECT id, 0, CURRENT_TIMESTAMP FROM movies ORDER BY id"))
+                for statement in change_statements:
+                    connection.execute(text(statement))
@@ -0,0 +1,35 @@
+import asyncio
+import threading
+import weakref
+
+class WriteQueue():
+
+    # SQLite allows one writer at a time. Writers in this process wait
+    # here in order instead of all taking turns on the busy_timeout.
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._async_locks = weakref.WeakKeyDictionary()
+
+    def __enter__(self):
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._lock.release()
+
+    def _async_lock(self) -> asyncio.Lock:
+        # asyncio locks belong to one event loop
+        loop = asyncio.get_running_loop()
+        lock = self._async_locks.get(loop)
+        if lock is None:
+            lock = self._async_locks[loop] = asyncio.Lock()
+        return lock
+
+    async def __aenter__(self):
+        await self._async_lock().acquire()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self._async_lock().release()
+
+write_queue = WriteQueue()
@@ -1,13 +1,48 @@
-from starlette.middleware.base import BaseHTTPMiddleware
-from fastapi import FastAPI, Request, Response
+from collections import Counter
+from threading import Lock
 from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
 
-class ErrorHandler(BaseHTTPMiddleware):
-    def __init__(self, app: FastAPI) -> None:
-        super().__init__(app)
+class ErrorCounters():
+
+    def __init__(self) -> None:
+        self.counts = Counter()
+        self._lock = Lock()
+
+    def add(self, exception: Exception) -> None:
+        with self._lock:
+            self.counts[type(exception).__name__] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"total": sum(self.counts.values()), "by_type": dict(self.counts)}
+
+error_counters = ErrorCounters()
+
+class ErrorHandler():
+
+    # Plain ASGI, the body is passed through untouched so streaming responses keep streaming
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        response_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
 
-    async def dispatch(self, request: Request, call_next) -> Response | JSONResponse:
         try:
-            return await call_next(request)
+            await self.app(scope, receive, send_wrapper)
         except Exception as e:
-            return JSONResponse(status_code=500, content={'error': str(e)})
\ No newline at end of file
+            error_counters.add(e)
+            # Headers already went out, nothing left to do but let the server drop the connection
+            if response_started:
+                raise
+            response = JSONResponse(status_code=500, content={'error': str(e)})
+            await response(scope, receive, send)
@@ -0,0 +1,46 @@
+import time
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+from utils.request_stats import RequestStats, current_request, route_metrics, report_repeated_statements
+
+class Instrumentation():
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.route_paths = {}
+
+    def route_path(self, scope: Scope) -> str:
+        # The router stores the matched endpoint in the scope, map it back to its path template
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self.route_paths.get(endpoint)
+        if path is None:
+            paths = {getattr(i, "endpoint", None): i.path for i in scope["app"].routes}
+            path = self.route_paths[endpoint] = paths.get(endpoint, "unmatched")
+        return path
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                total = (time.perf_counter() - start) * 1000
+                server_timing = f'app;dur={total:.1f}, db;dur={stats.db_time * 1000:.1f};desc="{stats.statements} statements"'
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", server_timing.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            method, route = scope["method"], self.route_path(scope)
+            route_metrics.record(method, route, status, time.perf_counter() - start, stats)
+            report_repeated_statements(method, route, stats)
@@ -1,15 +1,19 @@
 from fastapi.security import HTTPBearer
 from fastapi import Request, HTTPException
+from jwt.exceptions import InvalidTokenError
 from utils.jwt_manager import validate_token
-from schemas.user import User
-from services.user import UserService
-from config.dabatase import Session
+from services.user import AsyncUserService
+from config.dabatase import AsyncSessionLocal
 
 class JWTBearer(HTTPBearer):
     async def __call__(self, request: Request):
         auth = await super().__call__(request)
-        data = validate_token(auth.credentials)
-        db = Session()
-        result = UserService(db).authenticate_user(User(**data))
-        if not result:
-            raise HTTPException(status_code=403, detail="Credenciales son invalidas")
\ No newline at end of file
+        try:
+            data = validate_token(auth.credentials)
+        except InvalidTokenError:
+            raise HTTPException(status_code=403, detail="Credenciales son invalidas")
+        async with AsyncSessionLocal() as db:
+            version = await AsyncUserService(db).get_token_version(int(data["sub"]))
+        if version is None or version != data["ver"]:
+            raise HTTPException(status_code=403, detail="Credenciales son invalidas")
+        return data
@@ -0,0 +1,32 @@
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+from utils.profiler import profiler
+
+class Profiling():
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    def match(self, scope: Scope):
+        for route in scope["app"].routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Only an empty dict check while nothing is armed
+        if scope["type"] != "http" or not profiler.armed:
+            await self.app(scope, receive, send)
+            return
+        route = self.match(scope)
+        key = (scope["method"], route.path) if route is not None else None
+        if key is None or not profiler.take(key):
+            await self.app(scope, receive, send)
+            return
+        code = route.endpoint.__code__
+        profiler.begin(key, code)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.end(key, code)
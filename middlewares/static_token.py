@@ -0,0 +1,19 @@
+import hmac
+import os
+from fastapi.security import HTTPBearer
+from fastapi import Request, HTTPException
+
+class StaticTokenBearer(HTTPBearer):
+
+    # For scrapers and operators that cannot log in, the token comes from an environment variable.
+    # With the variable unset every request is refused.
+    def __init__(self, env_name: str) -> None:
+        super().__init__()
+        self.env_name = env_name
+
+    async def __call__(self, request: Request):
+        auth = await super().__call__(request)
+        expected = os.getenv(self.env_name)
+        if not expected or not hmac.compare_digest(auth.credentials.encode(), expected.encode()):
+            raise HTTPException(status_code=403, detail="Credenciales son invalidas")
+        return auth
@@ -1,5 +1,6 @@
 from config.dabatase import Base
-from sqlalchemy import Column, Integer, String, Float
+from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Index, literal_column
 from sqlalchemy.orm import relationship
 
 class Movie(Base):
@@ -12,3 +13,32 @@ class Movie(Base):
     year = Column(Integer)
     rating = Column(Float)
     category = Column(String)
+    # Bumped by every UPDATE, they back the ETag and Last-Modified headers
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=literal_column("version") + 1)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    # Sent as headers, not in the response body
+    hidden_columns = ("version", "updated_at")
+
+    # Keyset pagination seeks on (sort column, id), optionally within a category
+    __table_args__ = (
+        Index("ix_movies_category_id", "category", "id"),
+        Index("ix_movies_category_year_id", "category", "year", "id"),
+        Index("ix_movies_category_rating_id", "category", "rating", "id"),
+        Index("ix_movies_year_id", "year", "id"),
+        Index("ix_movies_rating_id", "rating", "id"),
+    )
+
+class MovieChange(Base):
+
+    __tablename__ = "movie_changes"
+
+    # Append-only, written by triggers on movies (config/migrations.py) in the
+    # writing transaction. The id is the cursor of the change feed.
+    id = Column(Integer, primary_key=True)
+    movie_id = Column(Integer, nullable=False)
+    deleted = Column(Boolean, nullable=False, default=False)
+    changed_at = Column(DateTime)
+
+    # AUTOINCREMENT, an id is never handed out twice
+    __table_args__ = {"sqlite_autoincrement": True}
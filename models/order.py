@@ -1,6 +1,7 @@
 from config.dabatase import Base
-from sqlalchemy import Column, Integer, String, Float, Date
-from sqlalchemy import ForeignKey
+from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, literal_column
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import declared_attr
 
@@ -11,9 +12,21 @@ class Order(Base):
     id = Column(Integer, primary_key=True)
     date_created = Column(Date)
     user_id = Column(Integer, ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    # Bumped by every UPDATE, changes to the lines update the order too
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=literal_column("version") + 1)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     user = relationship('User', backref='users')
 
+    # Sent as headers, not in the response body
+    hidden_columns = ("version", "updated_at")
+
+    __table_args__ = (
+        Index("ix_orders_user_id_id", "user_id", "id"),
+        Index("ix_orders_user_id_date_created_id", "user_id", "date_created", "id"),
+        Index("ix_orders_date_created_id", "date_created", "id"),
+    )
+
 
 class OrderMovie(Base):
 
@@ -26,6 +39,11 @@ class OrderMovie(Base):
     order = relationship('Order', backref='orders')
     movie = relationship('Movie', backref='movies')
 
+    # Reverse lookups from a movie to the orders that contain it
+    __table_args__ = (
+        Index("ix_order_movies_movie_id", "movie_id"),
+    )
+
     @declared_attr
     def __mapper_args__(cls):
         return {
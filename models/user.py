@@ -9,4 +9,5 @@ class User(Base):
     id = Column(Integer, primary_key= True)
     username = Column(String, unique=True)
     password = Column(String)
-    email = Column(String, unique=True)
\ No newline at end of file
+    email = Column(String, unique=True)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from fastapi import Depends, Header, Query, status
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from middlewares.jwt_bearer import JWTBearer
+from utils.events import event_bus
+
+events_router = APIRouter()
+
+@events_router.get(
+        path='/events',
+        tags=['events'],
+        status_code=status.HTTP_200_OK,
+        summary="Movie and order changes as server-sent events",
+        dependencies=[Depends(JWTBearer())])
+async def get_events(topics: Optional[str] = Query(None, regex="^(movies|orders)(,(movies|orders))*$"), last_event_id: Optional[int] = Header(None, ge=0)):
+    stream = event_bus.stream(topics.split(",") if topics else None, last_event_id)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream, media_type="text/event-stream", headers=headers)
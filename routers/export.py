@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from fastapi import Depends, Path, Query, status
+from fastapi.responses import StreamingResponse
+from middlewares.jwt_bearer import JWTBearer
+from services.export import export_stream, export_media_types
+
+export_router = APIRouter()
+
+@export_router.get(
+        path='/export/{table}',
+        tags=['export'],
+        status_code=status.HTTP_200_OK,
+        summary="Stream a whole table as NDJSON or CSV",
+        dependencies=[Depends(JWTBearer())])
+def export_table(table: str = Path(..., regex="^(movies|orders|order_movies)$"), format: str = Query("ndjson", regex="^(ndjson|csv)$"), batch_size: int = Query(1000, ge=1, le=10000)):
+    headers = {"Content-Disposition": f'attachment; filename="{table}.{format}"'}
+    return StreamingResponse(export_stream(table, format, batch_size), media_type=export_media_types[format], headers=headers)
@@ -0,0 +1,98 @@
+from fastapi import APIRouter
+from fastapi import status, Depends, Query, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from config.dabatase import get_pool_stats
+from services.movie_cache import movie_cache
+from middlewares.jwt_bearer import JWTBearer
+from middlewares.error_handler import error_counters
+from middlewares.static_token import StaticTokenBearer
+from utils.request_stats import route_metrics
+from utils.profiler import profiler
+from utils.events import event_bus
+from schemas.profiling import ProfileRequest
+from routers.movie import movie_router
+from routers.order import order_router
+from routers.user import user_router
+
+monitoring_router = APIRouter()
+
+profiled_routes = {(m, i.path) for router in (movie_router, order_router, user_router) for i in router.routes for m in i.methods}
+
+@monitoring_router.get(
+        path='/monitoring/pool',
+        tags=['monitoring'],
+        response_model=dict,
+        status_code=status.HTTP_200_OK,
+        summary="Database connection pool statistics",
+        dependencies=[Depends(JWTBearer())])
+def get_pool():
+    return JSONResponse(status_code=status.HTTP_200_OK, content=get_pool_stats())
+
+
+@monitoring_router.get(
+        path='/monitoring/cache',
+        tags=['monitoring'],
+        response_model=dict,
+        status_code=status.HTTP_200_OK,
+        summary="Movie read cache statistics",
+        dependencies=[Depends(JWTBearer())])
+def get_cache():
+    return JSONResponse(status_code=status.HTTP_200_OK, content=movie_cache.stats())
+
+
+@monitoring_router.get(
+        path='/monitoring/errors',
+        tags=['monitoring'],
+        response_model=dict,
+        status_code=status.HTTP_200_OK,
+        summary="Unhandled exceptions by type",
+        dependencies=[Depends(JWTBearer())])
+def get_errors():
+    return JSONResponse(status_code=status.HTTP_200_OK, content=error_counters.stats())
+
+
+@monitoring_router.get(
+        path='/monitoring/events',
+        tags=['monitoring'],
+        response_model=dict,
+        status_code=status.HTTP_200_OK,
+        summary="Server-sent event subscribers and evictions",
+        dependencies=[Depends(JWTBearer())])
+def get_events():
+    return JSONResponse(status_code=status.HTTP_200_OK, content=event_bus.stats())
+
+
+@monitoring_router.get(
+        path='/metrics',
+        tags=['monitoring'],
+        status_code=status.HTTP_200_OK,
+        summary="Per-route request metrics in Prometheus text format",
+        dependencies=[Depends(StaticTokenBearer("METRICS_TOKEN"))])
+def get_metrics():
+    return PlainTextResponse(route_metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@monitoring_router.post(
+        path='/monitoring/profile',
+        tags=['monitoring'],
+        response_model=dict,
+        status_code=status.HTTP_202_ACCEPTED,
+        summary="Sample the next requests to a route",
+        dependencies=[Depends(StaticTokenBearer("PROFILING_TOKEN"))])
+def arm_profile(profile: ProfileRequest):
+    key = (profile.method, profile.route)
+    if key not in profiled_routes:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Route not found")
+    profiler.arm(key, profile.requests, profile.interval_ms / 1000)
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=profiler.status(key))
+
+@monitoring_router.get(
+        path='/monitoring/profile',
+        tags=['monitoring'],
+        status_code=status.HTTP_200_OK,
+        summary="Collapsed stacks sampled for a route",
+        dependencies=[Depends(StaticTokenBearer("PROFILING_TOKEN"))])
+def get_profile(method: str = Query(...), route: str = Query(...)):
+    key = (method, route)
+    headers = {"X-Profile-" + k.capitalize(): str(v) for k, v in profiler.status(key).items()}
+    return PlainTextResponse(profiler.report(key), headers=headers)
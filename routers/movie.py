@@ -1,14 +1,17 @@
-from fastapi import APIRouter
-from fastapi import Depends, Path, Body, status, HTTPException
-from fastapi.responses import JSONResponse
+import time
+from fastapi import APIRouter, Request
+from fastapi import Depends, Path, Body, Query, status, HTTPException
+from fastapi.responses import JSONResponse, Response
 from fastapi.encoders import jsonable_encoder
 
-from typing import List
-from models.movie import Movie as MovieModel
-from schemas.movie import Movie
-from services.movie import MovieService
+from typing import List, Optional
+from schemas.movie import Movie, MovieQuery, MovieUpdate, MovieChanges
+from services.movie import AsyncMovieService
 from middlewares.jwt_bearer import JWTBearer
-from config.dabatase import Session
+from config.dabatase import get_async_db
+from utils.import_rows import read_rows, import_media_types
+from utils.serializer import FastJSONResponse
+from utils.conditional import make_etag, validator_headers, is_not_modified, not_modified_response
 
 movie_router = APIRouter()
 
@@ -18,24 +21,84 @@ movie_router = APIRouter()
         status_code=status.HTTP_200_OK, 
         summary="Get All Movies",
         dependencies=[Depends(JWTBearer())])
-def get_movies():
-    db = Session()
-    result = MovieService(db).get_movies()
-    return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(result))
+async def get_movies(request: Request, params: MovieQuery = Depends(), db = Depends(get_async_db)):
+    service = AsyncMovieService(db)
+    # Any write to movies bumps the revision, read before the page so a racing write only costs a 200
+    revision = await service.get_movies_revision()
+    etag = make_etag("movies", revision.revision)
+    if is_not_modified(request.headers, etag, revision.updated_at):
+        return not_modified_response(etag, revision.updated_at)
+    try:
+        result, next_cursor = await service.get_movies(params)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    headers = validator_headers(etag, revision.updated_at)
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=result, headers=headers)
 
 @movie_router.get(
-        path='/movies/{id}', 
+        path='/movies/search',
+        tags=['movies'],
+        response_model=List[Movie],
+        status_code=status.HTTP_200_OK,
+        summary="Search movies by title and overview",
+        dependencies=[Depends(JWTBearer())])
+async def search_movies(q: str = Query(..., min_length=1, max_length=100), limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0), db = Depends(get_async_db)):
+    result = await AsyncMovieService(db).search_movies(q, limit, offset)
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=result)
+
+@movie_router.get(
+        path='/movies/top',
+        tags=['movies'],
+        response_model=List[dict],
+        status_code=status.HTTP_200_OK,
+        summary="Get the best rated movies",
+        dependencies=[Depends(JWTBearer())])
+async def get_top_movies(n: int = Query(10, ge=1, le=1000), category: Optional[str] = None, year_min: Optional[int] = None, year_max: Optional[int] = None, rating_min: Optional[float] = None, db = Depends(get_async_db)):
+    result = await AsyncMovieService(db).get_top_movies(n, category=category, year_min=year_min, year_max=year_max, rating_min=rating_min)
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=result)
+
+@movie_router.get(
+        path='/movies/facets',
+        tags=['movies'],
+        response_model=dict,
+        status_code=status.HTTP_200_OK,
+        summary="Count movies by category or year",
+        dependencies=[Depends(JWTBearer())])
+async def get_movie_facets(field: str = Query("category", regex="^(category|year)$"), category: Optional[str] = None, year_min: Optional[int] = None, year_max: Optional[int] = None, rating_min: Optional[float] = None, rating_max: Optional[float] = None, db = Depends(get_async_db)):
+    result = await AsyncMovieService(db).get_movie_facets(field, category=category, year_min=year_min, year_max=year_max, rating_min=rating_min, rating_max=rating_max)
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=result)
+
+@movie_router.get(
+        path='/movies/changes',
+        tags=['movies'],
+        response_model=MovieChanges,
+        status_code=status.HTTP_200_OK,
+        summary="Movies created, updated or deleted after a cursor",
+        dependencies=[Depends(JWTBearer())])
+async def get_movie_changes(since: int = Query(0, ge=0), limit: int = Query(500, ge=1, le=5000), db = Depends(get_async_db)):
+    result = await AsyncMovieService(db).get_movie_changes(since, limit)
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=result)
+
+@movie_router.get(
+        path='/movies/{id}',
         tags=['movies'], 
         response_model=Movie,
         status_code=status.HTTP_200_OK,
         summary="Get movie by id",
         dependencies=[Depends(JWTBearer())])
-def get_movie_by_id(id: int = Path(...)):
-    db = Session()
-    result = MovieService(db).get_movie(id)
-    if not result:
+async def get_movie_by_id(request: Request, id: int = Path(...), db = Depends(get_async_db)):
+    service = AsyncMovieService(db)
+    entry = service.get_cached_movie(id)
+    validators = entry[1:] if entry else await service.get_movie_validators(id)
+    if validators and is_not_modified(request.headers, *validators):
+        return not_modified_response(*validators)
+    entry = entry or (validators and await service.load_movie_json(id))
+    if not entry:
          raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Movie not found")
-    return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(result))
+    body, etag, last_modified = entry
+    return Response(status_code=status.HTTP_200_OK, content=body, media_type="application/json", headers=validator_headers(etag, last_modified))
 
 @movie_router.get(
         path='/movies/category/{category}', 
@@ -44,12 +107,11 @@ def get_movie_by_id(id: int = Path(...)):
         status_code=status.HTTP_200_OK,
         summary="Get movies by category",
         dependencies=[Depends(JWTBearer())])
-def get_movies_by_category(category: str = Path(..., min_length=5, max_length=15)):
-    db = Session()
-    result = MovieService(db).get_movies_by_category(category)
-    if not result:
+async def get_movies_by_category(category: str = Path(..., min_length=5, max_length=15), db = Depends(get_async_db)):
+    body = await AsyncMovieService(db).get_movies_by_category_json(category)
+    if not body:
          raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
-    return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(result))
+    return Response(status_code=status.HTTP_200_OK, content=body, media_type="application/json")
 
 @movie_router.post(
         path='/movies', 
@@ -58,11 +120,31 @@ def get_movies_by_category(category: str = Path(..., min_length=5, max_length=15
         status_code=status.HTTP_201_CREATED,
         summary="Create a new Movie",
         dependencies=[Depends(JWTBearer())])
-def create_movie(movie: Movie):
-    db = Session()
-    MovieService(db).create_movie(movie)    
+async def create_movie(movie: Movie, db = Depends(get_async_db)):
+    await AsyncMovieService(db).create_movie(movie)    
     return JSONResponse(status_code=status.HTTP_201_CREATED, content={"message": "Se ha registrado la película"})
 
+@movie_router.post(
+        path='/movies/import',
+        tags=['movies'],
+        response_model=dict,
+        status_code=status.HTTP_200_OK,
+        summary="Import movies from a JSON array, NDJSON or CSV body",
+        dependencies=[Depends(JWTBearer())])
+async def import_movies(request: Request, chunk_size: int = Query(1000, ge=1, le=10000), db = Depends(get_async_db)):
+    media_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if media_type not in import_media_types:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Expected " + ", ".join(import_media_types))
+    start = time.perf_counter()
+    try:
+        report = await AsyncMovieService(db).import_movies(read_rows(await request.body(), media_type), chunk_size)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    seconds = time.perf_counter() - start
+    report["seconds"] = round(seconds, 3)
+    report["rows_per_second"] = round((report["imported"] + report["failed"]) / seconds, 1) if seconds else None
+    return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(report))
+
 @movie_router.put(
         path='/movies/{id}', 
         tags=['movies'], 
@@ -70,12 +152,21 @@ def create_movie(movie: Movie):
         status_code=status.HTTP_200_OK,
         summary="Update a movie",
         dependencies=[Depends(JWTBearer())])
-def update_movie(id: int = Path(...), movie: Movie = Body(...)):
-    db = Session()
-    result = MovieService(db).get_movie(id)
-    if not result:
+async def update_movie(id: int = Path(...), movie: Movie = Body(...), db = Depends(get_async_db)):
+    if not await AsyncMovieService(db).update_movie(id, movie):
+         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Movie not found")
+    return JSONResponse(status_code=status.HTTP_200_OK, content={"message": "Modified movie"})
+
+@movie_router.patch(
+        path='/movies/{id}',
+        tags=['movies'],
+        response_model=dict,
+        status_code=status.HTTP_200_OK,
+        summary="Update some fields of a movie",
+        dependencies=[Depends(JWTBearer())])
+async def patch_movie(id: int = Path(...), movie: MovieUpdate = Body(...), db = Depends(get_async_db)):
+    if not await AsyncMovieService(db).update_movie(id, movie):
          raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Movie not found")
-    MovieService(db).update_movie(id, movie)
     return JSONResponse(status_code=status.HTTP_200_OK, content={"message": "Modified movie"})
 
 @movie_router.delete(
@@ -85,10 +176,7 @@ def update_movie(id: int = Path(...), movie: Movie = Body(...)):
         status_code=status.HTTP_200_OK,
         summary="Delete a movie",
         dependencies=[Depends(JWTBearer())])
-def delete_movie(id: int = Path(...)):
-    db = Session()
-    result: MovieModel = db.query(MovieModel).filter(MovieModel.id == id).first()
-    if not result:
+async def delete_movie(id: int = Path(...), db = Depends(get_async_db)):
+    if not await AsyncMovieService(db).delete_movie(id):
          raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Movie not found")
-    MovieService(db).delete_movie(id)
-    return JSONResponse(status_code=status.HTTP_200_OK, content={"message": "Movie removed"})
\ No newline at end of file
+    return JSONResponse(status_code=status.HTTP_200_OK, content={"message": "Movie removed"})
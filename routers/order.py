@@ -1,18 +1,19 @@
-from fastapi import APIRouter
-from fastapi import Depends, Path, Query
-from fastapi.responses import JSONResponse
-from config.dabatase import Session
+from fastapi import APIRouter, Request
+from fastapi import Depends, Path, Query, Header
+from fastapi.responses import JSONResponse, Response
+from config.dabatase import get_async_db
 from models.order import Order as OrderModel
-from fastapi.encoders import jsonable_encoder
+from utils.serializer import FastJSONResponse, to_dict
+from utils.conditional import validator_headers, is_not_modified, not_modified_response
+from utils.idempotency import idempotency_store, request_fingerprint
 from middlewares.jwt_bearer import JWTBearer
-from schemas.order import Order
-from services.order import OrderService
+from schemas.order import Order, OrderQuery
+from services.order import AsyncOrderService
 from fastapi import status, Body
-from models.user import User
+from services.user import AsyncUserService
 from fastapi import HTTPException
-from typing import List
+from typing import List, Optional
 from schemas.movie import MovieCreated
-from schemas.order import OrderMovie
 from schemas.movie import Movie
 
 order_router = APIRouter()
@@ -23,10 +24,13 @@ order_router = APIRouter()
         response_model=List[Order],
         status_code=status.HTTP_200_OK,
         summary="Get All Orders")
-def get_orders():
-    db = Session()
-    result = OrderService(db).get_orders()
-    return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(result))
+async def get_orders(params: OrderQuery = Depends(), db = Depends(get_async_db)):
+    try:
+        result, next_cursor = await AsyncOrderService(db).get_orders(params)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=result, headers=headers)
 
 @order_router.get(
         path='/orders/{id}', 
@@ -34,12 +38,18 @@ def get_orders():
         response_model=Order,
         status_code=status.HTTP_200_OK,
         summary="Get Order By Id")
-def get_order_by_id(id: int = Path(...)):
-    db = Session()
-    result = OrderService(db).get_order_by_Id(id)
+async def get_order_by_id(request: Request, id: int = Path(...), include: Optional[str] = Query(None, regex="^movies$"), db = Depends(get_async_db)):
+    service = AsyncOrderService(db)
+    validators = await service.get_order_validators(id, include == "movies")
+    if validators and is_not_modified(request.headers, *validators):
+        return not_modified_response(*validators)
+    result = validators and await service.get_order_by_Id(id)
     if not result:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
-    return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(result))
+    content = to_dict(result)
+    if include == "movies":
+        content["movies"] = await service.get_order_movies_by_id(id)
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=content, headers=validator_headers(*validators))
 
 @order_router.get(
         path='/orders/movies/{id_order}', 
@@ -47,13 +57,13 @@ def get_order_by_id(id: int = Path(...)):
         response_model=List[Movie],
         status_code=status.HTTP_200_OK,
         summary="Get Movies of Order By Id")
-def get_order_movies_by_id(id_order: int = Path(...)):
-    db = Session()
-    result = OrderService(db).get_order_by_Id(id_order)
-    if not result:
+async def get_order_movies_by_id(id_order: int = Path(...), db = Depends(get_async_db)):
+    service = AsyncOrderService(db)
+    result_movies = await service.get_order_movies_by_id(id_order)
+    # An order with lines exists, so only empty results need the extra lookup
+    if not result_movies and not await service.get_order_by_Id(id_order):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
-    result_movies = OrderService(db).get_order_movies_by_id(id_order)
-    return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(result_movies))
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=result_movies)
 
 @order_router.post(
         path='/orders/{id_user}',
@@ -61,18 +71,37 @@ def get_order_movies_by_id(id_order: int = Path(...)):
         status_code=status.HTTP_201_CREATED,
         response_model=dict,
         summary="Create a new Order")
-def create_order(id_user: int = Path(...), movies: List[MovieCreated] = Body(...)):
-    db = Session()
-    user = db.query(User).filter(User.id == id_user).first()
+async def create_order(id_user: int = Path(...), movies: List[MovieCreated] = Body(...), idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255), db = Depends(get_async_db)):
+    if idempotency_key is None:
+        return await place_order(id_user, movies, db)
+    # Answered before any database work when the key was seen
+    fingerprint = request_fingerprint(id_user, [i.dict() for i in movies])
+    state, stored = idempotency_store.begin(idempotency_key, fingerprint)
+    if state == "mismatch":
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Idempotency-Key already used with a different request")
+    if state == "in_flight":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A request with this Idempotency-Key is in progress")
+    if state == "replay":
+        return Response(status_code=stored[0], content=stored[1], media_type="application/json", headers={"Idempotent-Replayed": "true"})
+    try:
+        response = await place_order(id_user, movies, db)
+    except BaseException:
+        # Only a created order is stored, a 404 retried after the fix runs again
+        idempotency_store.abort(idempotency_key)
+        raise
+    idempotency_store.finish(idempotency_key, fingerprint, response.status_code, response.body)
+    return response
+
+async def place_order(id_user: int, movies: List[MovieCreated], db):
+    user = await AsyncUserService(db).get_user_by_Id(id_user)
     if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    # Create order
+    service = AsyncOrderService(db)
+    if await service.get_missing_movie_ids([i.id for i in movies]):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Movie not found")
+    # Order and OrderMovie rows in one transaction
     order = Order(user_id=id_user)
-    id_order = OrderService(db).create_order(order).id
-    # Create OrderMovie
-    for i in movies:
-        order_movie = OrderMovie(order_id=id_order, movie_id=i.id, quantity=i.quantity)
-        OrderService(db).create_order_movie(order_movie)
+    await service.create_order_with_movies(order, movies)
     return JSONResponse(status_code=status.HTTP_201_CREATED, content={"message": "Order Created"})
 
 @order_router.put(
@@ -81,15 +110,12 @@ def create_order(id_user: int = Path(...), movies: List[MovieCreated] = Body(...
         response_model=dict, 
         status_code=status.HTTP_200_OK,
         summary="Update Order")
-def update_order(id: int, movies: List[MovieCreated] = Body(...)):
-    db = Session()
-    result = OrderService(db).get_order_by_Id(id)
-    if not result:
+async def update_order(id: int, movies: List[MovieCreated] = Body(...), db = Depends(get_async_db)):
+    service = AsyncOrderService(db)
+    if await service.get_missing_movie_ids([i.id for i in movies]):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Movie not found")
+    if not await service.replace_order_movies(id, movies):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
-    OrderService(db).delete_movies_of_order(id)
-    for i in movies:
-        order_movie = OrderMovie(order_id=id, movie_id=i.id, quantity=i.quantity)
-        OrderService(db).create_order_movie(order_movie)
     return JSONResponse(status_code=status.HTTP_200_OK, content={"message": "Se ha modificado el Order"})
 
 @order_router.delete(
@@ -98,11 +124,7 @@ def update_order(id: int, movies: List[MovieCreated] = Body(...)):
         response_model=dict, 
         status_code=status.HTTP_200_OK,
         summary="Delete Order")
-def delete_order(id: int = Path(...)):
-    db = Session()
-    result = OrderService(db).get_order_by_Id(id)
-    if not result:
+async def delete_order(id: int = Path(...), db = Depends(get_async_db)):
+    if not await AsyncOrderService(db).delete_order(id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not Found")
-    OrderService(db).delete_order(id)
-    OrderService(db).get_order_movies_by_id(id)
     return JSONResponse(status_code=status.HTTP_200_OK, content={"message": "Order removed"})
\ No newline at end of file
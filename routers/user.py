@@ -3,28 +3,61 @@ from fastapi.responses import JSONResponse
 from fastapi import APIRouter
 from fastapi.encoders import jsonable_encoder
 from fastapi import HTTPException
+from jwt.exceptions import InvalidTokenError
 
-from schemas.user import User, UserLogin, UserSingUp
-from services.user import UserService
+from schemas.user import User, UserLogin, UserSingUp, TokenRefresh
+from services.user import AsyncUserService
 from middlewares.jwt_bearer import JWTBearer
-from utils.jwt_manager import get_password_hash
-from utils.jwt_manager import create_token
-from config.dabatase import Session
+from utils.password_hasher import password_hasher
+from utils.jwt_manager import create_token, validate_token
+from config.dabatase import get_async_db
 
 user_router = APIRouter()
 
+def create_tokens(user_id: int, token_version: int):
+    return {
+        "access_token": create_token(user_id, token_version),
+        "refresh_token": create_token(user_id, token_version, token_type="refresh"),
+        "token_type": "bearer"
+    }
+
 @user_router.post(
           path="/login", 
           status_code=status.HTTP_200_OK,
           tags=["users"],
           summary="Login user in the app",
           response_model=dict)
-def login(user: UserLogin = Body(...)):
-     db = Session()
-     result = UserService(db).authenticate_user(user)
-     if result:
-        token: str = create_token(user.dict())
-        return JSONResponse(status_code=status.HTTP_200_OK, content=token)
+async def login(user: UserLogin = Body(...), db = Depends(get_async_db)):
+     result = await AsyncUserService(db).get_user_by_username(user.username)
+     if not result or not await password_hasher.verify(user.password, result.password):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or password")
+     return JSONResponse(status_code=status.HTTP_200_OK, content=create_tokens(result.id, result.token_version))
+
+@user_router.post(
+          path="/refresh",
+          status_code=status.HTTP_200_OK,
+          tags=["users"],
+          summary="Refresh access token",
+          response_model=dict)
+async def refresh(data: TokenRefresh = Body(...), db = Depends(get_async_db)):
+     try:
+        claims = validate_token(data.refresh_token, token_type="refresh")
+     except InvalidTokenError:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Credenciales son invalidas")
+     user = await AsyncUserService(db).get_user_by_Id(int(claims["sub"]))
+     if not user or user.token_version != claims["ver"]:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Credenciales son invalidas")
+     return JSONResponse(status_code=status.HTTP_200_OK, content=create_tokens(user.id, user.token_version))
+
+@user_router.post(
+          path="/logout",
+          status_code=status.HTTP_200_OK,
+          tags=["users"],
+          summary="Revoke every token of the user",
+          response_model=dict)
+async def logout(claims: dict = Depends(JWTBearer()), db = Depends(get_async_db)):
+     await AsyncUserService(db).revoke_tokens(int(claims["sub"]))
+     return JSONResponse(status_code=status.HTTP_200_OK, content={"message": "Tokens revoked"})
 
 @user_router.post(
         path="/signup",
@@ -32,14 +65,14 @@ def login(user: UserLogin = Body(...)):
         tags=["users"],
         status_code=status.HTTP_201_CREATED,
         summary="Create new User")
-def signup(user: User = Body(...)):
-      db = Session()
-      existing_user = UserService(db).get_user_by_username(user.username)
+async def signup(user: User = Body(...), db = Depends(get_async_db)):
+      service = AsyncUserService(db)
+      existing_user = await service.get_user_by_username(user.username)
       if existing_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists")
-      hashed_password = get_password_hash(user.password)
+      hashed_password = await password_hasher.hash(user.password)
       user.password = hashed_password
-      result = UserService(db).create_user(user)
+      result = await service.create_user(user)
       signup_user = UserSingUp(username=result.username, email=result.email)
       return JSONResponse(status_code=status.HTTP_201_CREATED, content=jsonable_encoder(signup_user))
 
@@ -50,12 +83,9 @@ def signup(user: User = Body(...)):
         status_code=status.HTTP_200_OK,
         summary="Delete User",
         dependencies=[Depends(JWTBearer())])
-def delete_user(id_user: int = Path(...)):
-    db = Session()
-    user = UserService(db).get_user_by_Id(id_user)
-    if user is None:
+async def delete_user(id_user: int = Path(...), db = Depends(get_async_db)):
+    if not await AsyncUserService(db).delete_user(id_user):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    UserService(db).delete_user(id_user)
     return JSONResponse(status_code=status.HTTP_200_OK, content={"message": "User removed"})
 
 @user_router.put(
@@ -65,10 +95,7 @@ def delete_user(id_user: int = Path(...)):
         status_code=status.HTTP_200_OK,
         summary="Update data User",
         dependencies=[Depends(JWTBearer())])
-def update_user(id_user: int = Path(...), user: User = Body(...)):
-    db = Session()
-    result = UserService(db).get_user_by_Id(id_user)
-    if not result:
+async def update_user(id_user: int = Path(...), user: User = Body(...), db = Depends(get_async_db)):
+    if not await AsyncUserService(db).update_user(id_user, user):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    UserService(db).update_user(id_user, user)
     return JSONResponse(status_code=status.HTTP_200_OK, content={"message": "Modified User"})
@@ -1,3 +1,4 @@
+from typing import List, Optional
 from pydantic import BaseModel, Field
 
 class BaseMovie(BaseModel):
@@ -10,7 +11,38 @@ class BaseMovie(BaseModel):
 class Movie(BaseMovie):
     pass
 
+class MovieUpdate(BaseModel):
+    title: Optional[str] = Field(None, min_length=5, max_length=15, example="Mi película")
+    overview: Optional[str] = Field(None, min_length=15, max_length=50, example="Descripción de la película")
+    year: Optional[int] = Field(None, le=2022, example=2022)
+    rating: Optional[float] = Field(None, ge=1, le=10, example=9.8)
+    category: Optional[str] = Field(None, min_length=5, max_length=15, example="Acción")
+
 class MovieCreated(BaseMovie):
     id: int = Field(..., example="1")
     quantity:int = Field(...,ge=1,example="1")
 
+
+class MovieQuery(BaseModel):
+    limit: int = Field(100, ge=1, le=1000)
+    cursor: Optional[str] = None
+    category: Optional[str] = None
+    year_min: Optional[int] = None
+    year_max: Optional[int] = None
+    rating_min: Optional[float] = None
+    rating_max: Optional[float] = None
+    sort: str = Field("id", regex="^-?(id|year|rating)$")
+
+class MovieImport(BaseMovie):
+    id: Optional[int] = Field(None, ge=1)
+
+class MovieChange(BaseModel):
+    cursor: int
+    id: int
+    deleted: bool
+    movie: Optional[Movie] = None
+
+class MovieChanges(BaseModel):
+    changes: List[MovieChange]
+    cursor: int
+    more: bool
@@ -1,3 +1,4 @@
+from typing import Optional
 from datetime import datetime
 from pydantic import BaseModel, Field
 
@@ -10,11 +11,9 @@ class OrderMovie(BaseModel):
     movie_id: int = Field(..., example="1")
     quantity: int = Field(..., example="1")
 
+class OrderQuery(BaseModel):
+    limit: int = Field(100, ge=1, le=1000)
+    cursor: Optional[str] = None
+    user_id: Optional[int] = None
+    sort: str = Field("id", regex="^-?(id|date_created)$")
 
-        
-
-
-
-
-
-    
@@ -0,0 +1,7 @@
+from pydantic import BaseModel, Field
+
+class ProfileRequest(BaseModel):
+    method: str = Field(..., regex="^(GET|POST|PUT|PATCH|DELETE)$", example="GET")
+    route: str = Field(..., example="/movies/{id}")
+    requests: int = Field(10, ge=1, le=1000)
+    interval_ms: float = Field(5, ge=1, le=1000)
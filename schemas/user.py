@@ -12,3 +12,6 @@ class UserLogin(BaseModel):
 class UserSingUp(BaseModel):
     username: str = Field(...)
     email:str = EmailStr(...)
+
+class TokenRefresh(BaseModel):
+    refresh_token: str = Field(...)
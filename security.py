@@ -1,20 +1,39 @@
 from fastapi import FastAPI
 from fastapi.responses import HTMLResponse
-from config.dabatase import engine, Base
+from config.dabatase import engine, async_engine, Base
+from config.migrations import migrate
 from middlewares.error_handler import ErrorHandler
+from middlewares.instrumentation import Instrumentation
+from middlewares.profiling import Profiling
+from utils.request_stats import instrument
 from routers.movie import movie_router
 from routers.user import user_router
 from routers.order import order_router
+from routers.monitoring import monitoring_router
+from routers.export import export_router
+from routers.events import events_router
 from sqlalchemy import Table
 
 app = FastAPI()
 app.title = "Mi aplicación con  FastAPI"
 app.version = "0.0.1"
 Base.metadata.create_all(bind=engine)
+migrate(engine)
+instrument(engine, async_engine.sync_engine)
+app.add_middleware(Profiling)
 app.add_middleware(ErrorHandler)
+app.add_middleware(Instrumentation)
 app.include_router(movie_router)
 app.include_router(user_router)
 app.include_router(order_router)
+app.include_router(monitoring_router)
+app.include_router(export_router)
+app.include_router(events_router)
+
+@app.on_event("shutdown")
+async def dispose_engines():
+    await async_engine.dispose()
+    engine.dispose()
 
 @app.get('/', tags=['home'])
 def message():
@@ -0,0 +1,129 @@
+import os
+import time
+from threading import Lock
+import numpy as np
+from sqlalchemy import select
+from models.movie import Movie as MovieModel
+
+class CatalogSnapshot():
+
+    # Columns of the movies table kept as NumPy arrays sorted by id. Missing
+    # years and ratings are stored as NaN so they never pass a range filter.
+    def __init__(self, max_age: float) -> None:
+        self.max_age = max_age
+        self.loaded_at = None
+        self.ids = np.empty(0, dtype=np.int64)
+        self.years = np.empty(0, dtype=np.float64)
+        self.ratings = np.empty(0, dtype=np.float64)
+        self.codes = np.empty(0, dtype=np.int32)
+        self.categories = []
+        self.category_codes = {}
+        self._lock = Lock()
+
+    def is_stale(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.max_age
+
+    def load(self, rows) -> None:
+        rows = sorted(rows, key=lambda i: i[0])
+        categories = sorted({i[3] for i in rows if i[3] is not None})
+        category_codes = {c: code for code, c in enumerate(categories)}
+        with self._lock:
+            self.ids = np.array([i[0] for i in rows], dtype=np.int64)
+            self.years = np.array([np.nan if i[1] is None else i[1] for i in rows], dtype=np.float64)
+            self.ratings = np.array([np.nan if i[2] is None else i[2] for i in rows], dtype=np.float64)
+            self.categories = categories
+            self.category_codes = category_codes
+            self.codes = np.array([category_codes.get(i[3], -1) for i in rows], dtype=np.int32)
+            self.loaded_at = time.monotonic()
+
+    def reset(self) -> None:
+        # Bulk writes rebuild the arrays on the next read instead of patching them row by row
+        with self._lock:
+            self.loaded_at = None
+
+    def _code(self, category):
+        if category is None:
+            return -1
+        code = self.category_codes.get(category)
+        if code is None:
+            code = self.category_codes[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+
+    def upsert(self, id: int, year, rating, category) -> None:
+        with self._lock:
+            if self.loaded_at is None:
+                return
+            year = np.nan if year is None else year
+            rating = np.nan if rating is None else rating
+            code = self._code(category)
+            position = np.searchsorted(self.ids, id)
+            if position < len(self.ids) and self.ids[position] == id:
+                self.years[position] = year
+                self.ratings[position] = rating
+                self.codes[position] = code
+                return
+            self.ids = np.insert(self.ids, position, id)
+            self.years = np.insert(self.years, position, year)
+            self.ratings = np.insert(self.ratings, position, rating)
+            self.codes = np.insert(self.codes, position, code)
+
+    def remove(self, id: int) -> None:
+        with self._lock:
+            position = np.searchsorted(self.ids, id)
+            if position < len(self.ids) and self.ids[position] == id:
+                self.ids = np.delete(self.ids, position)
+                self.years = np.delete(self.years, position)
+                self.ratings = np.delete(self.ratings, position)
+                self.codes = np.delete(self.codes, position)
+
+    def _mask(self, category=None, year_min=None, year_max=None, rating_min=None, rating_max=None):
+        mask = np.ones(len(self.ids), dtype=bool)
+        if category is not None:
+            mask &= self.codes == self.category_codes.get(category, -2)
+        if year_min is not None:
+            mask &= self.years >= year_min
+        if year_max is not None:
+            mask &= self.years <= year_max
+        if rating_min is not None:
+            mask &= self.ratings >= rating_min
+        if rating_max is not None:
+            mask &= self.ratings <= rating_max
+        return mask
+
+    def top(self, n: int, **filters) -> list:
+        with self._lock:
+            candidates = np.flatnonzero(self._mask(**filters) & ~np.isnan(self.ratings))
+            ratings = self.ratings[candidates]
+            if len(candidates) > n:
+                best = np.argpartition(-ratings, n - 1)[:n]
+                candidates, ratings = candidates[best], ratings[best]
+            # Highest rating first, lowest id first among equal ratings
+            order = np.lexsort((self.ids[candidates], -ratings))
+            return [self._row(i) for i in candidates[order]]
+
+    def facets(self, field: str, **filters) -> dict:
+        with self._lock:
+            mask = self._mask(**filters)
+            if field == "category":
+                counts = np.bincount(self.codes[mask & (self.codes >= 0)], minlength=len(self.categories))
+                return {self.categories[i]: int(c) for i, c in enumerate(counts) if c}
+            years, counts = np.unique(self.years[mask & ~np.isnan(self.years)], return_counts=True)
+            return {str(int(y)): int(c) for y, c in zip(years, counts)}
+
+    def _row(self, position) -> dict:
+        code = int(self.codes[position])
+        return {
+            "id": int(self.ids[position]),
+            "year": None if np.isnan(self.years[position]) else int(self.years[position]),
+            "rating": None if np.isnan(self.ratings[position]) else float(self.ratings[position]),
+            "category": self.categories[code] if code >= 0 else None
+        }
+
+    async def ensure_loaded(self, db) -> None:
+        # Each worker rebuilds its copy after max_age to pick up other workers' writes
+        if self.is_stale():
+            result = await db.execute(select(MovieModel.id, MovieModel.year, MovieModel.rating, MovieModel.category))
+            self.load(result.all())
+
+catalog_snapshot = CatalogSnapshot(max_age=float(os.getenv("CATALOG_SNAPSHOT_MAX_AGE", 60)))
@@ -0,0 +1,63 @@
+import csv
+import io
+import json
+from datetime import date
+from sqlalchemy import select
+from config.dabatase import Session
+from models.movie import Movie as MovieModel
+from models.order import Order as OrderModel, OrderMovie as OrderMovieModel
+
+export_tables = {
+    "movies": MovieModel,
+    "orders": OrderModel,
+    "order_movies": OrderMovieModel
+}
+
+export_media_types = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+def export_columns(name: str):
+    # Same columns as the API bodies
+    model = export_tables[name]
+    hidden = getattr(model, "hidden_columns", ())
+    return [i for i in model.__table__.columns if i.key not in hidden]
+
+def export_value(value):
+    return value.isoformat() if isinstance(value, date) else value
+
+class ExportService():
+
+    def __init__(self, db) -> None:
+        self.db = db
+
+    def batches(self, name: str, batch_size: int):
+        table = export_tables[name].__table__
+        statement = select(*export_columns(name)).order_by(*table.primary_key.columns)
+        # yield_per streams the cursor, only one batch of rows is held at a time
+        result = self.db.execute(statement.execution_options(yield_per=batch_size))
+        for partition in result.partitions():
+            yield [[export_value(i) for i in row] for row in partition]
+
+    def ndjson(self, name: str, batch_size: int):
+        columns = [i.key for i in export_columns(name)]
+        for rows in self.batches(name, batch_size):
+            yield "".join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+
+    def csv(self, name: str, batch_size: int):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([i.key for i in export_columns(name)])
+        for rows in self.batches(name, batch_size):
+            writer.writerows(rows)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+def export_stream(name: str, format: str, batch_size: int):
+    # The session lives as long as the response body, not the request handler
+    with Session() as db:
+        yield from getattr(ExportService(db), format)(name, batch_size)
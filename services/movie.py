@@ -1,15 +1,123 @@
-from models.movie import Movie as MovieModel
-from schemas.movie import Movie
+import re
+from datetime import datetime, timezone
+from sqlalchemy import select, insert, update, delete, func, literal_column, table, column
+from sqlalchemy import DateTime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from pydantic import ValidationError
+from config.write_queue import write_queue
+from models.movie import Movie as MovieModel, MovieChange as MovieChangeModel
+from schemas.movie import Movie, MovieQuery, MovieImport, MovieUpdate
+from utils.pagination import keyset, next_page
+from utils.serializer import dumps
+from utils.conditional import make_etag
+from services.movie_cache import movie_cache
+from services.catalog_snapshot import catalog_snapshot
+from utils.events import event_bus
+
+def movies_query(params: MovieQuery):
+    statement = select(MovieModel)
+    if params.category is not None:
+        statement = statement.where(MovieModel.category == params.category)
+    if params.year_min is not None:
+        statement = statement.where(MovieModel.year >= params.year_min)
+    if params.year_max is not None:
+        statement = statement.where(MovieModel.year <= params.year_max)
+    if params.rating_min is not None:
+        statement = statement.where(MovieModel.rating >= params.rating_min)
+    if params.rating_max is not None:
+        statement = statement.where(MovieModel.rating <= params.rating_max)
+    column = params.sort.lstrip("-")
+    return keyset(statement, getattr(MovieModel, column), MovieModel.id, params.sort.startswith("-"), params.cursor, params.limit)
+
+movies_fts = table("movies_fts", column("rowid"))
+table_revisions = table("table_revisions", column("name"), column("revision"), column("updated_at", DateTime))
+
+def revision_query(name: str):
+    return select(table_revisions.c.revision, table_revisions.c.updated_at).where(table_revisions.c.name == name)
+
+def movie_validators(id: int, version: int, updated_at):
+    return make_etag("movie", id, version), updated_at
+
+def search_terms(q: str):
+    # Every word must match, the last one also as a prefix ("matr" finds "Matrix")
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    return " ".join(f'"{i}"' for i in words[:-1]) + f' "{words[-1]}"*'
+
+def search_query(terms: str, limit: int, offset: int):
+    return (select(MovieModel)
+            .join(movies_fts, movies_fts.c.rowid == MovieModel.id)
+            .where(literal_column("movies_fts").op("MATCH")(terms))
+            .order_by(func.bm25(literal_column("movies_fts")))
+            .limit(limit)
+            .offset(offset))
+
+def changes_query(since: int, limit: int):
+    # The current row of each changed movie, none for a tombstone
+    return (select(MovieChangeModel.id, MovieChangeModel.movie_id, MovieChangeModel.deleted, MovieModel)
+            .outerjoin(MovieModel, MovieModel.id == MovieChangeModel.movie_id)
+            .where(MovieChangeModel.id > since)
+            .order_by(MovieChangeModel.id)
+            .limit(limit + 1))
+
+def change_batch(rows: list, since: int, limit: int):
+    more = len(rows) > limit
+    rows = rows[:limit]
+    latest = {movie_id: cursor for cursor, movie_id, _, _ in rows}
+    changes = []
+    for cursor, movie_id, deleted, movie in rows:
+        # A later change in the batch already carries the current row
+        if latest[movie_id] != cursor:
+            continue
+        # No row left means a delete further down the log
+        if deleted or movie is None:
+            changes.append({"cursor": cursor, "id": movie_id, "deleted": True, "movie": None})
+        else:
+            changes.append({"cursor": cursor, "id": movie_id, "deleted": False, "movie": movie})
+    return {"changes": changes, "cursor": rows[-1][0] if rows else since, "more": more}
+
+def movie_saved(id: int, movie: Movie):
+    movie_cache.invalidate(id, movie.category)
+    catalog_snapshot.upsert(id, movie.year, movie.rating, movie.category)
+
+def movie_deleted(id: int):
+    movie_cache.invalidate(id)
+    catalog_snapshot.remove(id)
+    event_bus.publish("movies.deleted", {"id": id})
+
+def movie_update(id: int, values: dict):
+    # The columns the snapshot needs come back with the update, no second read
+    return (update(MovieModel)
+            .where(MovieModel.id == id)
+            .values(**values)
+            .returning(MovieModel.year, MovieModel.rating, MovieModel.category))
+
+def movie_values(data: Movie | MovieUpdate):
+    # Only the fields the client sent, null counts as not sent
+    return data.dict(exclude_unset=True, exclude_none=True)
+
+def movies_imported(ids, count: int, categories):
+    movie_cache.invalidate_many(ids, categories)
+    catalog_snapshot.reset()
+    event_bus.publish("movies.imported", {"count": count, "replaced": list(ids)})
+
+def movies_upsert():
+    statement = sqlite_insert(MovieModel)
+    columns = ["title", "overview", "year", "rating", "category"]
+    # set_ skips the columns' onupdate, the version is bumped here
+    values = {i: statement.excluded[i] for i in columns}
+    values.update(version=MovieModel.version + 1, updated_at=datetime.now(timezone.utc))
+    return statement.on_conflict_do_update(index_elements=[MovieModel.id], set_=values)
 
 class MovieService():
     
     def __init__(self, db) -> None:
         self.db = db
 
-    def get_movies(self):
-        result = self.db.query(MovieModel).all()
-        print(result)
-        return result
+    def get_movies(self, params: MovieQuery = MovieQuery()):
+        result = self.db.execute(movies_query(params)).scalars().all()
+        return next_page(result, params.sort.lstrip("-"), params.limit)
 
     def get_movie(self, id):
         result = self.db.query(MovieModel).filter(MovieModel.id == id).first()
@@ -20,22 +128,173 @@ class MovieService():
         return result
 
     def create_movie(self, movie: Movie):
-        new_movie = MovieModel(**movie.dict())
-        self.db.add(new_movie)
-        self.db.commit()
-        return new_movie
-
-    def update_movie(self, id: int, data: Movie):
-        movie = self.db.query(MovieModel).filter(MovieModel.id == id).first()
-        movie.title = data.title
-        movie.overview = data.overview
-        movie.year = data.year
-        movie.rating = data.rating
-        movie.category = data.category
-        self.db.commit()
-        return
+        with write_queue:
+            new_movie = MovieModel(**movie.dict())
+            self.db.add(new_movie)
+            self.db.commit()
+            movie_saved(new_movie.id, new_movie)
+            event_bus.publish("movies.created", {"id": new_movie.id})
+            return new_movie
+
+    def update_movie(self, id: int, data: Movie | MovieUpdate):
+        values = movie_values(data)
+        if not values:
+            return self.get_movie(id) is not None
+        with write_queue:
+            row = self.db.execute(movie_update(id, values)).first()
+            self.db.commit()
+            if row is None:
+                return False
+            movie_saved(id, row)
+        event_bus.publish("movies.updated", {"id": id})
+        return True
     
     def delete_movie(self, id: int):
-       self.db.query(MovieModel).filter(MovieModel.id == id).delete()
-       self.db.commit()
-       return
\ No newline at end of file
+       with write_queue:
+           result = self.db.execute(delete(MovieModel).where(MovieModel.id == id))
+           self.db.commit()
+           if result.rowcount == 0:
+               return False
+           movie_deleted(id)
+       return True
+
+
+class AsyncMovieService():
+
+    def __init__(self, db) -> None:
+        self.db = db
+
+    async def get_movies(self, params: MovieQuery = MovieQuery()):
+        result = await self.db.execute(movies_query(params))
+        return next_page(result.scalars().all(), params.sort.lstrip("-"), params.limit)
+
+    async def get_movie(self, id):
+        result = await self.db.execute(select(MovieModel).where(MovieModel.id == id))
+        return result.scalars().first()
+
+    async def get_movies_by_category(self, category):
+        result = await self.db.execute(select(MovieModel).where(MovieModel.category == category))
+        return result.scalars().all()
+
+    async def create_movie(self, movie: Movie):
+        async with write_queue:
+            new_movie = MovieModel(**movie.dict())
+            self.db.add(new_movie)
+            await self.db.commit()
+            movie_saved(new_movie.id, new_movie)
+            event_bus.publish("movies.created", {"id": new_movie.id})
+            return new_movie
+
+    async def update_movie(self, id: int, data: Movie | MovieUpdate):
+        values = movie_values(data)
+        if not values:
+            return await self.get_movie(id) is not None
+        async with write_queue:
+            result = await self.db.execute(movie_update(id, values))
+            row = result.first()
+            await self.db.commit()
+            if row is None:
+                return False
+            movie_saved(id, row)
+        event_bus.publish("movies.updated", {"id": id})
+        return True
+
+    async def delete_movie(self, id: int):
+        async with write_queue:
+            result = await self.db.execute(delete(MovieModel).where(MovieModel.id == id))
+            await self.db.commit()
+            if result.rowcount == 0:
+                return False
+            movie_deleted(id)
+        return True
+
+    async def get_top_movies(self, n: int, **filters):
+        await catalog_snapshot.ensure_loaded(self.db)
+        return catalog_snapshot.top(n, **filters)
+
+    async def get_movie_facets(self, field: str, **filters):
+        await catalog_snapshot.ensure_loaded(self.db)
+        return catalog_snapshot.facets(field, **filters)
+
+    async def upsert_movies(self, rows: list):
+        # Rows with an id replace that movie, the rest are inserted, one transaction per chunk
+        existing = [i for i in rows if i["id"] is not None]
+        new = [{k: v for k, v in i.items() if k != "id"} for i in rows if i["id"] is None]
+        async with write_queue:
+            if new:
+                await self.db.execute(insert(MovieModel), new)
+            if existing:
+                await self.db.execute(movies_upsert(), existing)
+            await self.db.commit()
+        movies_imported([i["id"] for i in existing], len(rows), {i["category"] for i in rows})
+
+    async def import_movies(self, rows, chunk_size: int = 1000):
+        report = {"imported": 0, "failed": 0, "errors": []}
+        chunk = []
+        for number, row, error in rows:
+            if error is None:
+                try:
+                    chunk.append(MovieImport.parse_obj(row).dict())
+                except ValidationError as e:
+                    error = e.errors()
+            else:
+                error = [{"loc": [], "msg": error, "type": "value_error.decode"}]
+            if error is not None:
+                report["failed"] += 1
+                report["errors"].append({"row": number, "errors": error})
+            if len(chunk) == chunk_size:
+                await self.upsert_movies(chunk)
+                report["imported"] += len(chunk)
+                chunk = []
+        if chunk:
+            await self.upsert_movies(chunk)
+            report["imported"] += len(chunk)
+        return report
+
+    async def search_movies(self, q: str, limit: int = 20, offset: int = 0):
+        terms = search_terms(q)
+        if terms is None:
+            return []
+        result = await self.db.execute(search_query(terms, limit, offset))
+        return result.scalars().all()
+
+    async def get_movies_revision(self):
+        result = await self.db.execute(revision_query("movies"))
+        return result.first()
+
+    async def get_movie_changes(self, since: int, limit: int = 500):
+        result = await self.db.execute(changes_query(since, limit))
+        return change_batch(result.all(), since, limit)
+
+    def get_cached_movie(self, id):
+        return movie_cache.get_movie(id)
+
+    # (ETag, Last-Modified) of a movie, from a lookup that leaves the other columns out
+    async def get_movie_validators(self, id):
+        result = await self.db.execute(select(MovieModel.version, MovieModel.updated_at).where(MovieModel.id == id))
+        row = result.first()
+        return movie_validators(id, *row) if row else None
+
+    async def load_movie_json(self, id):
+        generation = movie_cache.generation
+        movie = await self.get_movie(id)
+        if not movie:
+            return None
+        entry = (dumps(movie), *movie_validators(id, movie.version, movie.updated_at))
+        movie_cache.set_movie(id, entry, generation)
+        return entry
+
+    # Cached reads return the encoded JSON body, or None when there is nothing to return
+    async def get_movie_json(self, id):
+        return self.get_cached_movie(id) or await self.load_movie_json(id)
+
+    async def get_movies_by_category_json(self, category):
+        body = movie_cache.get_category(category)
+        if body is None:
+            generation = movie_cache.generation
+            result = await self.get_movies_by_category(category)
+            if not result:
+                return None
+            body = dumps(result)
+            movie_cache.set_category(category, body, [i.id for i in result], generation)
+        return body
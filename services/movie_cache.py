@@ -0,0 +1,53 @@
+import os
+from threading import Lock
+from utils.cache import TTLCache
+
+class MovieCache():
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Movie ids inside each cached category body, to find the lists a write touches
+        self.category_ids = {}
+        # Bumped by every write, so a read that raced with one is not cached
+        self.generation = 0
+        self._lock = Lock()
+
+    def get_movie(self, id: int):
+        return self.cache.get(("movie", id))
+
+    # Movie entries are (body, etag, last_modified)
+    def set_movie(self, id: int, entry: tuple, generation: int) -> None:
+        with self._lock:
+            if generation == self.generation:
+                self.cache.set(("movie", id), entry)
+
+    def get_category(self, category: str):
+        return self.cache.get(("category", category))
+
+    def set_category(self, category: str, body: bytes, ids, generation: int) -> None:
+        with self._lock:
+            if generation == self.generation:
+                self.category_ids[category] = set(ids)
+                self.cache.set(("category", category), body)
+
+    def invalidate(self, id: int, *categories: str) -> None:
+        self.invalidate_many([id], categories)
+
+    def invalidate_many(self, ids, categories) -> None:
+        # Drops the movies and every cached list that holds one or should now hold one
+        ids, categories = set(ids), set(categories)
+        with self._lock:
+            self.generation += 1
+            for id in ids:
+                self.cache.pop(("movie", id))
+            stale = [c for c, cached in self.category_ids.items() if not cached.isdisjoint(ids) or c in categories]
+            for category in set(stale) | categories:
+                self.category_ids.pop(category, None)
+                self.cache.pop(("category", category))
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+movie_cache = MovieCache(
+    maxsize=int(os.getenv("MOVIE_CACHE_SIZE", 10000)),
+    ttl=float(os.getenv("MOVIE_CACHE_TTL", 300)))
@@ -1,71 +1,267 @@
-from schemas.order import Order, OrderMovie
+from sqlalchemy import select, insert, update, delete
+from config.write_queue import write_queue
+from typing import List
+from schemas.order import Order, OrderMovie, OrderQuery
 from models.order import Order as OrderModel
 from models.order import OrderMovie as OrderMovieModel
 from schemas.movie import Movie, MovieCreated
 from models.movie import Movie as MovieModel
+from utils.pagination import keyset, next_page
+from utils.conditional import make_etag, latest
+from services.movie import revision_query
+from utils.events import event_bus
+
+def order_movies_query(id_order):
+    # Lines and their movies in a single round trip
+    return (select(MovieModel, OrderMovieModel.quantity)
+            .join(OrderMovieModel, OrderMovieModel.movie_id == MovieModel.id)
+            .where(OrderMovieModel.order_id == id_order))
+
+def movie_created(movie: MovieModel, quantity: int):
+    return MovieCreated(
+        id=movie.id,
+        title=movie.title,
+        overview=movie.overview,
+        year=movie.year,
+        rating=movie.rating,
+        category=movie.category,
+        quantity=quantity
+        )
+
+def orders_query(params: OrderQuery):
+    statement = select(OrderModel)
+    if params.user_id is not None:
+        statement = statement.where(OrderModel.user_id == params.user_id)
+    column = params.sort.lstrip("-")
+    return keyset(statement, getattr(OrderModel, column), OrderModel.id, params.sort.startswith("-"), params.cursor, params.limit)
+
+def order_lines_query(id_order):
+    # The order row comes back even without lines, so an empty result means no order
+    return (select(OrderModel.id, OrderMovieModel.movie_id, OrderMovieModel.quantity)
+            .outerjoin(OrderMovieModel, OrderMovieModel.order_id == OrderModel.id)
+            .where(OrderModel.id == id_order))
+
+def order_bump(id_order):
+    # Line changes move the order's own version, its ETag covers them
+    return update(OrderModel).where(OrderModel.id == id_order).values(version=OrderModel.version + 1)
+
+def order_validators(id_order: int, version: int, updated_at, movies=None):
+    # The movies revision joins in when the response embeds the movies
+    if movies is None:
+        return make_etag("order", id_order, version), updated_at
+    return make_etag("order", id_order, version, "movies", movies.revision), latest(updated_at, movies.updated_at)
+
+def merge_lines(movies: List[MovieCreated]):
+    quantities = {}
+    for i in movies:
+        quantities[i.id] = quantities.get(i.id, 0) + i.quantity
+    return quantities
+
+def diff_lines(id_order: int, current: dict, wanted: dict):
+    removed = [i for i in current if i not in wanted]
+    changed = [{"order_id": id_order, "movie_id": i, "quantity": q} for i, q in wanted.items() if i in current and current[i] != q]
+    added = [{"order_id": id_order, "movie_id": i, "quantity": q} for i, q in wanted.items() if i not in current]
+    return removed, changed, added
 
 class OrderService():
     
     def __init__(self, db) -> None:
         self.db = db
 
-    def get_orders(self):
-        result = self.db.query(OrderModel).all()
-        return result
+    def get_orders(self, params: OrderQuery = OrderQuery()):
+        result = self.db.execute(orders_query(params)).scalars().all()
+        return next_page(result, params.sort.lstrip("-"), params.limit)
     
     def create_order(self, movie: Order):
-        new_order = OrderModel(**movie.dict())
-        self.db.add(new_order)
-        self.db.commit()
-        return new_order
+        with write_queue:
+            new_order = OrderModel(**movie.dict())
+            self.db.add(new_order)
+            self.db.commit()
+            event_bus.publish("orders.created", {"id": new_order.id, "user_id": new_order.user_id})
+            return new_order
     
     def get_order_by_Id(self, id):
         result = self.db.query(OrderModel).filter(OrderModel.id == id).first()
         return result
 
     def update_order(self, id: int, data: Order):
-        order = self.db.query(OrderModel).filter(OrderModel.id == id).first()
-        order.user_id = data.user_id
-        self.db.commit()
-        return
+        with write_queue:
+            result = self.db.execute(update(OrderModel).where(OrderModel.id == id).values(user_id=data.user_id))
+            self.db.commit()
+        if result.rowcount == 0:
+            return False
+        event_bus.publish("orders.updated", {"id": id})
+        return True
     
     def delete_order(self, id: int):
-       self.db.query(OrderModel).filter(OrderModel.id == id).delete()
-       self.db.commit()
-       return
+       with write_queue:
+           result = self.db.execute(delete(OrderModel).where(OrderModel.id == id))
+           # SQLite does not enforce the ON DELETE CASCADE without the foreign_keys pragma
+           self.db.execute(delete(OrderMovieModel).where(OrderMovieModel.order_id == id))
+           self.db.commit()
+       if result.rowcount == 0:
+           return False
+       event_bus.publish("orders.deleted", {"id": id})
+       return True
     
     #OrderMovie
     def create_order_movie(self, order_movie: OrderMovie):
-        new_order_movie = OrderMovieModel(**order_movie.dict())
-        self.db.add(new_order_movie)
-        self.db.commit()
-        return new_order_movie
+        with write_queue:
+            new_order_movie = OrderMovieModel(**order_movie.dict())
+            self.db.add(new_order_movie)
+            self.db.commit()
+            return new_order_movie
     
     def get_order_movies_by_id(self, id_order):
-        result = self.db.query(OrderMovieModel).filter(OrderMovieModel.order_id == id_order).all()
-        list_result = []
-        if not result:
-            return [] 
-        for i in result:
-            movie = self.db.query(MovieModel).filter(MovieModel.id == i.movie_id).first()
-            movie_created = MovieCreated(
-                id=movie.id, 
-                title=movie.title, 
-                overview=movie.overview,
-                year=movie.year,
-                rating=movie.rating,
-                category=movie.category,
-                quantity=i.quantity
-                )
-            list_result.append(movie_created)
-        return list_result
+        result = self.db.execute(order_movies_query(id_order)).all()
+        return [movie_created(movie, quantity) for movie, quantity in result]
     
     def delete_movies_of_order(self, id_order):
-        self.db.query(OrderMovieModel).filter(OrderMovieModel.order_id == id_order).delete()
-        self.db.commit()
+        with write_queue:
+            self.db.query(OrderMovieModel).filter(OrderMovieModel.order_id == id_order).delete()
+            self.db.commit()
         return
 
+    def get_missing_movie_ids(self, ids):
+        found = self.db.execute(select(MovieModel.id).where(MovieModel.id.in_(set(ids)))).scalars().all()
+        return sorted(set(ids) - set(found))
+
+    def create_order_with_movies(self, order: Order, movies: List[MovieCreated]):
+        with write_queue:
+            new_order = OrderModel(**order.dict())
+            self.db.add(new_order)
+            self.db.flush()
+            rows = [{"order_id": new_order.id, "movie_id": i, "quantity": q} for i, q in merge_lines(movies).items()]
+            if rows:
+                self.db.execute(insert(OrderMovieModel), rows)
+            self.db.commit()
+            event_bus.publish("orders.created", {"id": new_order.id, "user_id": new_order.user_id})
+            return new_order
+
+    def replace_order_movies(self, id_order, movies: List[MovieCreated]):
+        with write_queue:
+            rows = self.db.execute(order_lines_query(id_order)).all()
+            if not rows:
+                return False
+            current = {movie_id: quantity for _, movie_id, quantity in rows if movie_id is not None}
+            removed, changed, added = diff_lines(id_order, current, merge_lines(movies))
+            if removed:
+                self.db.execute(delete(OrderMovieModel).where(OrderMovieModel.order_id == id_order, OrderMovieModel.movie_id.in_(removed)))
+            if changed:
+                self.db.execute(update(OrderMovieModel), changed)
+            if added:
+                self.db.execute(insert(OrderMovieModel), added)
+            if removed or changed or added:
+                self.db.execute(order_bump(id_order))
+            self.db.commit()
+        if removed or changed or added:
+            event_bus.publish("orders.updated", {"id": id_order})
+        return True
+
+
 
+class AsyncOrderService():
+
+    def __init__(self, db) -> None:
+        self.db = db
+
+    async def get_orders(self, params: OrderQuery = OrderQuery()):
+        result = await self.db.execute(orders_query(params))
+        return next_page(result.scalars().all(), params.sort.lstrip("-"), params.limit)
+
+    async def create_order(self, order: Order):
+        async with write_queue:
+            new_order = OrderModel(**order.dict())
+            self.db.add(new_order)
+            await self.db.commit()
+            event_bus.publish("orders.created", {"id": new_order.id, "user_id": new_order.user_id})
+            return new_order
+
+    async def get_order_by_Id(self, id):
+        result = await self.db.execute(select(OrderModel).where(OrderModel.id == id))
+        return result.scalars().first()
+
+    async def get_order_validators(self, id, include_movies: bool = False):
+        result = await self.db.execute(select(OrderModel.version, OrderModel.updated_at).where(OrderModel.id == id))
+        row = result.first()
+        if row is None:
+            return None
+        movies = None
+        if include_movies:
+            movies = (await self.db.execute(revision_query("movies"))).first()
+        return order_validators(id, *row, movies)
+
+    async def update_order(self, id: int, data: Order):
+        async with write_queue:
+            result = await self.db.execute(update(OrderModel).where(OrderModel.id == id).values(user_id=data.user_id))
+            await self.db.commit()
+        if result.rowcount == 0:
+            return False
+        event_bus.publish("orders.updated", {"id": id})
+        return True
+
+    async def delete_order(self, id: int):
+        async with write_queue:
+            result = await self.db.execute(delete(OrderModel).where(OrderModel.id == id))
+            # SQLite does not enforce the ON DELETE CASCADE without the foreign_keys pragma
+            await self.db.execute(delete(OrderMovieModel).where(OrderMovieModel.order_id == id))
+            await self.db.commit()
+        if result.rowcount == 0:
+            return False
+        event_bus.publish("orders.deleted", {"id": id})
+        return True
+
+    #OrderMovie
+    async def create_order_movie(self, order_movie: OrderMovie):
+        async with write_queue:
+            new_order_movie = OrderMovieModel(**order_movie.dict())
+            self.db.add(new_order_movie)
+            await self.db.commit()
+            return new_order_movie
+
+    async def get_order_movies_by_id(self, id_order):
+        result = await self.db.execute(order_movies_query(id_order))
+        return [movie_created(movie, quantity) for movie, quantity in result.all()]
+
+    async def delete_movies_of_order(self, id_order):
+        async with write_queue:
+            await self.db.execute(delete(OrderMovieModel).where(OrderMovieModel.order_id == id_order))
+            await self.db.commit()
+        return
 
+    async def get_missing_movie_ids(self, ids):
+        result = await self.db.execute(select(MovieModel.id).where(MovieModel.id.in_(set(ids))))
+        return sorted(set(ids) - set(result.scalars().all()))
 
+    async def create_order_with_movies(self, order: Order, movies: List[MovieCreated]):
+        async with write_queue:
+            new_order = OrderModel(**order.dict())
+            self.db.add(new_order)
+            await self.db.flush()
+            rows = [{"order_id": new_order.id, "movie_id": i, "quantity": q} for i, q in merge_lines(movies).items()]
+            if rows:
+                await self.db.execute(insert(OrderMovieModel), rows)
+            await self.db.commit()
+            event_bus.publish("orders.created", {"id": new_order.id, "user_id": new_order.user_id})
+            return new_order
 
+    async def replace_order_movies(self, id_order, movies: List[MovieCreated]):
+        async with write_queue:
+            result = await self.db.execute(order_lines_query(id_order))
+            rows = result.all()
+            if not rows:
+                return False
+            current = {movie_id: quantity for _, movie_id, quantity in rows if movie_id is not None}
+            removed, changed, added = diff_lines(id_order, current, merge_lines(movies))
+            if removed:
+                await self.db.execute(delete(OrderMovieModel).where(OrderMovieModel.order_id == id_order, OrderMovieModel.movie_id.in_(removed)))
+            if changed:
+                await self.db.execute(update(OrderMovieModel), changed)
+            if added:
+                await self.db.execute(insert(OrderMovieModel), added)
+            if removed or changed or added:
+                await self.db.execute(order_bump(id_order))
+            await self.db.commit()
+        if removed or changed or added:
+            event_bus.publish("orders.updated", {"id": id_order})
+        return True
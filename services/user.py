@@ -1,20 +1,19 @@
+from sqlalchemy import select, update, delete
+from config.write_queue import write_queue
 from schemas.user import User
 from models.user import User as UserModel
-from utils.jwt_manager import verify_password
+from utils.cache import TTLCache
+
+# Current token version per user id, so access tokens are checked without a query.
+# Each worker keeps its own copy: a revocation made in another worker is seen
+# here once the entry expires, so revoked tokens live at most `ttl` seconds.
+token_version_cache = TTLCache(maxsize=10000, ttl=5)
 
 class UserService():
     
     def __init__(self, db) -> None:
         self.db = db
 
-    def authenticate_user(self, user: User):
-        result = self.db.query(UserModel).filter(UserModel.username == user.username).first()
-        if not result:
-            return False
-        if not verify_password(user.password, result.password):
-            return False
-        return True
-    
     def get_user_by_Id(self, id):
         result = self.db.query(UserModel).filter(UserModel.id == id).first()
         return result
@@ -24,24 +23,88 @@ class UserService():
         return result
 
     def create_user(self, user: User):
-        new_user = UserModel(**user.dict())
-        self.db.add(new_user)
-        self.db.commit()
-        return new_user
+        with write_queue:
+            new_user = UserModel(**user.dict())
+            self.db.add(new_user)
+            self.db.commit()
+            return new_user
     
     def delete_user(self, id: int):
-       self.db.query(UserModel).filter(UserModel.id == id).delete()
-       self.db.commit()
-       return
+       with write_queue:
+           result = self.db.execute(delete(UserModel).where(UserModel.id == id))
+           self.db.commit()
+           token_version_cache.pop(id)
+       return result.rowcount > 0
     
     def update_user(self, id: int, data: User):
-        user = self.db.query(UserModel).filter(UserModel.id == id).first()
-        user.username = data.username
-        user.email = data.email
-        self.db.commit()
+        with write_queue:
+            result = self.db.execute(update(UserModel).where(UserModel.id == id).values(username=data.username, email=data.email))
+            self.db.commit()
+        return result.rowcount > 0
+
+    def revoke_tokens(self, id: int):
+        with write_queue:
+            self.db.query(UserModel).filter(UserModel.id == id).update({UserModel.token_version: UserModel.token_version + 1})
+            self.db.commit()
+            token_version_cache.pop(id)
         return
     
     def delete_user_by_email(self, email: str):
-       self.db.query(UserModel).filter(UserModel.email == email).delete()
-       self.db.commit()
-       return
+       with write_queue:
+           ids = self.db.execute(delete(UserModel).where(UserModel.email == email).returning(UserModel.id)).scalars().all()
+           self.db.commit()
+           for id in ids:
+               token_version_cache.pop(id)
+       return bool(ids)
+
+
+
+class AsyncUserService():
+
+    def __init__(self, db) -> None:
+        self.db = db
+
+    async def get_user_by_Id(self, id):
+        result = await self.db.execute(select(UserModel).where(UserModel.id == id))
+        return result.scalars().first()
+
+    async def get_user_by_username(self, username):
+        result = await self.db.execute(select(UserModel).where(UserModel.username == username))
+        return result.scalars().first()
+
+    async def get_token_version(self, id: int):
+        version = token_version_cache.get(id)
+        if version is None:
+            result = await self.db.execute(select(UserModel.token_version).where(UserModel.id == id))
+            version = result.scalar()
+            if version is None:
+                return None
+            token_version_cache.set(id, version)
+        return version
+
+    async def create_user(self, user: User):
+        async with write_queue:
+            new_user = UserModel(**user.dict())
+            self.db.add(new_user)
+            await self.db.commit()
+            return new_user
+
+    async def delete_user(self, id: int):
+        async with write_queue:
+            result = await self.db.execute(delete(UserModel).where(UserModel.id == id))
+            await self.db.commit()
+            token_version_cache.pop(id)
+        return result.rowcount > 0
+
+    async def update_user(self, id: int, data: User):
+        async with write_queue:
+            result = await self.db.execute(update(UserModel).where(UserModel.id == id).values(username=data.username, email=data.email))
+            await self.db.commit()
+        return result.rowcount > 0
+
+    async def revoke_tokens(self, id: int):
+        async with write_queue:
+            await self.db.execute(update(UserModel).where(UserModel.id == id).values(token_version=UserModel.token_version + 1))
+            await self.db.commit()
+            token_version_cache.pop(id)
+        return
@@ -0,0 +1,133 @@
+import asyncio
+from fastapi.testclient import TestClient
+from security import app
+from fastapi import status
+from config.dabatase import Session
+from services.user import UserService
+from services.movie import MovieService
+from schemas.movie import Movie
+from utils.events import EventBus, event_bus
+import pytest
+
+credentials = {"username": "pruebaevents", "password": "prueba", "email": "pruebaevents@gmail.com"}
+
+movie = {
+        "title": "Test Pelicula",
+        "overview": "Descripción de la película",
+        "year": 2022,
+        "rating": 9.8,
+        "category": "EventsTest"
+        }
+
+@pytest.fixture(scope="module")
+def test_client():
+    client = TestClient(app)
+    client.post("/signup", json=credentials)
+    yield client
+    db = Session()
+    UserService(db).delete_user_by_email(credentials["email"])
+
+@pytest.fixture(scope="module")
+def headers(test_client):
+    response = test_client.post("/login", json={"username": credentials["username"], "password": credentials["password"]})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def read_stream(path: str, query: str, headers: dict, until: bytes, publish=None):
+    # Drives the ASGI app directly, TestClient waits for a streamed body to end
+    chunks, started, disconnected = [], [], asyncio.Event()
+    scope = {
+        "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": query.encode(), "server": ("testserver", 80), "client": ("testclient", 50000),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+    }
+
+    async def receive():
+        if not started:
+            started.append(True)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            started.append(message["status"])
+        elif message.get("body"):
+            chunks.append(message["body"])
+            if until in b"".join(chunks):
+                disconnected.set()
+
+    task = asyncio.create_task(app(scope, receive, send))
+    if publish is not None:
+        while not event_bus.stats()["subscribers"]:
+            await asyncio.sleep(0.01)
+        publish()
+    await asyncio.wait_for(task, 10)
+    return started[1], b"".join(chunks)
+
+def test_events_stream_resumes_from_last_event_id(test_client, headers):
+    event_bus.publish("orders.created", {"id": -1, "user_id": -1})
+    event_bus.publish("movies.deleted", {"id": -2})
+    event_bus.publish("orders.deleted", {"id": -1})
+    first = event_bus.last_id - 2
+    stream_headers = dict(headers, **{"Last-Event-ID": str(first)})
+    status_code, body = asyncio.run(read_stream("/events", "topics=orders", stream_headers, b"-3",
+                                                lambda: event_bus.publish("orders.deleted", {"id": -3})))
+    assert status_code == status.HTTP_200_OK
+    assert body.startswith(b"id: %d\nevent: orders.deleted\ndata: {\"id\":-1}\n\n" % (first + 2))
+    assert b"movies.deleted" not in body
+    assert body.endswith(b"event: orders.deleted\ndata: {\"id\":-3}\n\n")
+    assert event_bus.stats()["subscribers"] == 0
+    assert test_client.get("/events").status_code == status.HTTP_403_FORBIDDEN
+    assert test_client.get("/events", params={"topics": "users"}, headers=headers).status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert set(test_client.get("/monitoring/events", headers=headers).json()) == {"subscribers", "published", "evicted", "last_id", "history"}
+
+def test_services_publish_after_commit(test_client):
+    id_user = UserService(Session()).get_user_by_username(credentials["username"]).id
+
+    async def scenario():
+        stream = event_bus.stream()
+        first = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        # The sync services run in the threadpool, they publish from another thread
+        new_movie = await asyncio.to_thread(MovieService(Session()).create_movie, Movie(**movie))
+        frames = [await asyncio.wait_for(first, 5)]
+        await asyncio.to_thread(test_client.post, f"/orders/{id_user}", json=[dict(movie, id=new_movie.id, quantity=1)])
+        frames.append(await asyncio.wait_for(stream.__anext__(), 5))
+        await asyncio.to_thread(MovieService(Session()).delete_movie, new_movie.id)
+        frames.append(await asyncio.wait_for(stream.__anext__(), 5))
+        await stream.aclose()
+        return frames, new_movie.id
+
+    frames, id_movie = asyncio.run(scenario())
+    assert b"event: movies.created\ndata: {\"id\":%d}" % id_movie in frames[0]
+    assert b"event: orders.created" in frames[1]
+    assert b"\"user_id\":%d" % id_user in frames[1]
+    assert b"event: movies.deleted" in frames[2]
+
+def test_slow_consumer_is_evicted_and_gaps_reset():
+    bus = EventBus(queue_size=2, history=3)
+
+    async def scenario():
+        stream = bus.stream()
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        for i in range(5):
+            bus.publish("movies.updated", {"id": i})
+        # The overflow ends the stream, what was queued comes back on resume
+        frames = [await pending] + [i async for i in stream]
+        stats = bus.stats()
+        # Ids 3 to 5 are left in the history, resuming after 1 misses 2
+        resumed = bus.stream(last_event_id=1)
+        reset = await resumed.__anext__()
+        await resumed.aclose()
+        replayed = bus.stream(last_event_id=3)
+        frames_after_3 = [await replayed.__anext__(), await replayed.__anext__()]
+        await replayed.aclose()
+        return frames, stats, reset, frames_after_3
+
+    frames, stats, reset, frames_after_3 = asyncio.run(scenario())
+    assert frames == [b"event: evicted\ndata: {}\n\n"]
+    assert stats["evicted"] == 1
+    assert stats["subscribers"] == 0
+    assert reset == b"event: reset\ndata: {}\n\n"
+    assert [i.split(b"\n")[0] for i in frames_after_3] == [b"id: 4", b"id: 5"]
@@ -0,0 +1,78 @@
+from fastapi.testclient import TestClient
+from security import app
+from fastapi import status
+from config.dabatase import Session
+from services.user import UserService
+from services.export import export_stream
+from models.movie import Movie as MovieModel
+import csv
+import io
+import json
+import pytest
+
+credentials = {"username": "pruebaexport", "password": "prueba", "email": "pruebaexport@gmail.com"}
+
+movie = {
+        "title": "Test Pelicula",
+        "overview": "Descripción de la película",
+        "year": 2022,
+        "rating": 9.8,
+        "category": "ExportTest"
+        }
+
+def get_token():
+    data = {"username": credentials["username"], "password": credentials["password"]}
+    response = TestClient(app).post("/login", json=data)
+    return response.json()["access_token"]
+
+@pytest.fixture(scope="module")
+def test_client():
+    client = TestClient(app)
+    client.post("/signup", json=credentials)
+    yield client
+    db = Session()
+    db.query(MovieModel).filter(MovieModel.category == "ExportTest").delete()
+    db.commit()
+    UserService(db).delete_user_by_email(credentials["email"])
+
+@pytest.fixture(scope="module")
+def headers(test_client):
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    for i in range(3):
+        test_client.post("/movies", json=dict(movie, year=2000 + i), headers=headers)
+    id_user = UserService(Session()).get_user_by_username(credentials["username"]).id
+    id_movie = test_client.get("/movies", params={"category": "ExportTest"}, headers=headers).json()[0]["id"]
+    test_client.post("/orders/" + str(id_user), json=[dict(movie, id=id_movie, quantity=2)])
+    return headers
+
+def test_export_movies_ndjson(test_client, headers):
+    response = test_client.get("/export/movies", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(i) for i in response.text.splitlines()]
+    exported = [i for i in rows if i["category"] == "ExportTest"]
+    assert [i["year"] for i in exported] == [2000, 2001, 2002]
+    assert exported[0]["overview"] == movie["overview"]
+    assert [i["id"] for i in rows] == sorted(i["id"] for i in rows)
+
+def test_export_orders_csv(test_client, headers):
+    response = test_client.get("/export/orders", params={"format": "csv"}, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["id", "date_created", "user_id"]
+    assert len(rows) > 1
+    response = test_client.get("/export/order_movies", params={"format": "csv"}, headers=headers)
+    assert list(csv.reader(io.StringIO(response.text)))[0] == ["order_id", "movie_id", "quantity"]
+
+def test_export_streams_one_batch_per_chunk(test_client, headers):
+    total = len(test_client.get("/export/movies", headers=headers).text.splitlines())
+    chunks = list(export_stream("movies", "ndjson", 1))
+    assert len(chunks) == total
+    chunks = list(export_stream("movies", "csv", 2))
+    assert len(chunks) == (total + 1) // 2
+
+def test_export_validation_and_auth(test_client, headers):
+    assert test_client.get("/export/users", headers=headers).status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert test_client.get("/export/movies", params={"format": "xml"}, headers=headers).status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert test_client.get("/export/movies").status_code == status.HTTP_403_FORBIDDEN
@@ -0,0 +1,216 @@
+from fastapi.testclient import TestClient
+from security import app
+from fastapi import status
+from sqlalchemy import create_engine
+import asyncio
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from config.dabatase import Session, get_db, get_pool_stats, pool_options, profiles, configure_sqlite
+from config.dabatase import Base
+from services.movie import AsyncMovieService
+from schemas.movie import Movie
+from services.user import UserService
+from models.movie import Movie as MovieModel
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from middlewares.error_handler import ErrorHandler, error_counters
+from middlewares.instrumentation import Instrumentation
+from utils.request_stats import route_metrics
+from middlewares.profiling import Profiling
+from utils.profiler import profiler
+import time
+
+credentials = {"username": "pruebamonitor", "password": "prueba", "email": "pruebamonitor@gmail.com"}
+
+def get_token():
+    data = {"username": credentials["username"], "password": credentials["password"]}
+    response = TestClient(app).post("/login", json=data)
+    return response.json()["access_token"]
+
+@pytest.fixture(scope="module")
+def test_client():
+    client = TestClient(app)
+    client.post("/signup", json=credentials)
+    yield client
+    db = Session()
+    UserService(db).delete_user_by_email(credentials["email"])
+
+def test_get_db_rolls_back_and_closes_on_error():
+    checked_out = get_pool_stats()["checked_out"]
+    dependency = get_db()
+    db = next(dependency)
+    db.add(MovieModel(title="Rollback Test", category="RollbackTest"))
+    db.flush()
+    assert get_pool_stats()["checked_out"] == checked_out + 1
+    with pytest.raises(RuntimeError):
+        dependency.throw(RuntimeError("boom"))
+    assert get_pool_stats()["checked_out"] == checked_out
+    with Session() as db:
+        assert db.query(MovieModel).filter(MovieModel.category == "RollbackTest").first() is None
+
+def test_get_db_closes_after_request():
+    checked_out = get_pool_stats()["checked_out"]
+    dependency = get_db()
+    db = next(dependency)
+    db.query(MovieModel).first()
+    with pytest.raises(StopIteration):
+        next(dependency)
+    assert get_pool_stats()["checked_out"] == checked_out
+
+def test_pool_options_in_memory_database():
+    assert pool_options("sqlite://") == {}
+    engine = create_engine("sqlite://", **pool_options("sqlite://"))
+    engine.connect().close()
+
+def test_pool_stats(test_client):
+    headers = {
+        "Authorization": f"Bearer {get_token()}"
+    }
+    response = test_client.get("/monitoring/pool", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert set(response.json()) == {"size", "checked_in", "checked_out", "overflow"}
+
+def test_pool_stats_forbidden(test_client):
+    response = test_client.get("/monitoring/pool")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_production_profile_pragmas(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'prod.sqlite'}")
+    configure_sqlite(engine, profiles["production"]["pragmas"])
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+        assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() == 5000
+    assert profiles["production"]["echo"] is False
+
+def test_concurrent_writes_go_through_write_queue(tmp_path):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'writes.sqlite'}"
+    engine = create_async_engine(url)
+    configure_sqlite(engine.sync_engine, profiles["production"]["pragmas"])
+    sessions = async_sessionmaker(bind=engine, expire_on_commit=False)
+    movie = Movie(title="Test Pelicula", overview="Descripción de la película", year=2022, rating=9.8, category="QueueTest")
+
+    async def create():
+        async with sessions() as db:
+            return await AsyncMovieService(db).create_movie(movie)
+
+    async def burst():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        created = await asyncio.gather(*[create() for i in range(20)])
+        await engine.dispose()
+        return created
+
+    created = asyncio.run(burst())
+    assert len({i.id for i in created}) == 20
+
+def test_error_handler_contract_and_counters(test_client):
+    failing = FastAPI()
+    failing.add_middleware(ErrorHandler)
+
+    @failing.get("/boom")
+    def boom():
+        raise LookupError("missing thing")
+
+    @failing.get("/stream")
+    def stream():
+        return StreamingResponse(iter([b"a", b"b", b"c"]), media_type="text/plain")
+
+    before = error_counters.stats()["by_type"].get("LookupError", 0)
+    client = TestClient(failing, raise_server_exceptions=False)
+    response = client.get("/boom")
+    assert response.status_code == 500
+    assert response.json() == {"error": "missing thing"}
+    assert client.get("/stream").text == "abc"
+    assert client.get("/nothing").status_code == 404
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    stats = test_client.get("/monitoring/errors", headers=headers).json()
+    assert stats["by_type"]["LookupError"] == before + 1
+    assert stats["total"] >= before + 1
+
+def test_server_timing_and_metrics(test_client, monkeypatch):
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    response = test_client.get("/movies", params={"limit": 5}, headers=headers)
+    server_timing = response.headers["server-timing"]
+    assert server_timing.startswith("app;dur=")
+    assert "db;dur=" in server_timing
+    assert int(server_timing.split('desc="')[1].split()[0]) >= 1
+    assert test_client.get("/metrics", headers=headers).status_code == status.HTTP_403_FORBIDDEN
+    monkeypatch.setenv("METRICS_TOKEN", "scraper")
+    response = test_client.get("/metrics", headers={"Authorization": "Bearer scraper"})
+    assert response.status_code == status.HTTP_200_OK
+    assert 'http_requests_total{method="GET",route="/movies",status="200"}' in response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/movies"}' in response.text
+    assert 'db_statements_total{method="GET",route="/movies"}' in response.text
+
+def test_repeated_statements_are_flagged(caplog):
+    instrumented = FastAPI()
+    instrumented.add_middleware(Instrumentation)
+
+    @instrumented.get("/loop/{count}")
+    def loop(count: int):
+        with Session() as db:
+            for i in range(count):
+                db.query(MovieModel).filter(MovieModel.id == i).first()
+        return {}
+
+    client = TestClient(instrumented)
+    client.get("/loop/2")
+    assert route_metrics.routes[("GET", "/loop/{count}")]["n_plus_one"] == 0
+    client.get("/loop/6")
+    metrics = route_metrics.routes[("GET", "/loop/{count}")]
+    assert metrics["n_plus_one"] == 1
+    assert metrics["statements"] == 8
+    assert "Possible N+1 on GET /loop/{count}: 6 runs of SELECT" in caplog.text
+
+def test_profile_admin_endpoint(test_client, monkeypatch):
+    profile = {"method": "GET", "route": "/movies/top", "requests": 2, "interval_ms": 1}
+    assert test_client.post("/monitoring/profile", json=profile, headers={"Authorization": "Bearer admin"}).status_code == status.HTTP_403_FORBIDDEN
+    monkeypatch.setenv("PROFILING_TOKEN", "admin")
+    admin = {"Authorization": "Bearer admin"}
+    response = test_client.post("/monitoring/profile", json=dict(profile, route="/metrics"), headers=admin)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = test_client.post("/monitoring/profile", json=profile, headers=admin)
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.json() == {"remaining": 2, "profiled": 0, "samples": 0}
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    for i in range(3):
+        test_client.get("/movies/top", headers=headers)
+    response = test_client.get("/monitoring/profile", params={"method": "GET", "route": "/movies/top"}, headers=admin)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["x-profile-remaining"] == "0"
+    assert response.headers["x-profile-profiled"] == "2"
+
+def test_profiler_collects_stacks_of_the_route():
+    profiled = FastAPI()
+    profiled.add_middleware(Profiling)
+
+    def busy():
+        end = time.perf_counter() + 0.05
+        while time.perf_counter() < end:
+            pass
+
+    @profiled.get("/busy")
+    def busy_route():
+        busy()
+        return {}
+
+    @profiled.get("/other")
+    def other_route():
+        busy()
+        return {}
+
+    profiler.arm(("GET", "/busy"), 1, 0.001)
+    client = TestClient(profiled)
+    client.get("/other")
+    client.get("/busy")
+    client.get("/busy")
+    assert profiler.status(("GET", "/busy"))["profiled"] == 1
+    lines = profiler.report(("GET", "/busy")).splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert stack.split(";")[0].endswith(":busy_route")
+    assert stack.split(";")[-1].endswith(":busy")
+    assert int(count) > 5
+    assert profiler.armed == {}
@@ -5,7 +5,11 @@ from schemas.user import UserSingUp
 from config.dabatase import Session
 from services.user import UserService
 import pytest
-from utils.jwt_manager import create_token
+import json
+from models.movie import Movie as MovieModel, MovieChange as MovieChangeModel
+from services.movie_cache import movie_cache
+from sqlalchemy import event, func
+from config.dabatase import async_engine
 
 credentials = {"username": "prueba", "password": "prueba", "email": "prueba@gmail.com"}
 
@@ -20,8 +24,9 @@ movie = {
 id_movie_global = 0
 
 def get_token():
-    token = create_token(credentials)
-    return token
+    data = {"username": credentials["username"], "password": credentials["password"]}
+    response = TestClient(app).post("/login", json=data)
+    return response.json()["access_token"]
 
 @pytest.fixture(scope="module")
 def test_client():
@@ -129,4 +134,255 @@ def test_delete_movie_not_found(test_client):
     }
     response = test_client.delete("/movies/1000", headers=headers)
     assert response.status_code == status.HTTP_404_NOT_FOUND
-    assert response.json() == {"detail": "Movie not found"}
\ No newline at end of file
+    assert response.json() == {"detail": "Movie not found"}
+
+def test_get_movies_filters_and_keyset_pages(test_client, test_movie):
+    token = get_token()
+    headers = {
+        "Authorization": f"Bearer {token}"
+    }
+    for rating in (5.0, 6.0, 7.0):
+        test_client.post("/movies", json=dict(test_movie, rating=rating, category="PageTest"), headers=headers)
+    params = {"category": "PageTest", "rating_min": 5.5, "sort": "-rating", "limit": 1}
+    response = test_client.get("/movies", params=params, headers=headers)
+    ratings = [i["rating"] for i in response.json()]
+    while "X-Next-Cursor" in response.headers:
+        response = test_client.get("/movies", params=dict(params, cursor=response.headers["X-Next-Cursor"]), headers=headers)
+        ratings += [i["rating"] for i in response.json()]
+    assert ratings == [7.0, 6.0]
+    db = Session()
+    db.query(MovieModel).filter(MovieModel.category == "PageTest").delete()
+    db.commit()
+
+def test_get_movies_invalid_cursor(test_client):
+    token = get_token()
+    headers = {
+        "Authorization": f"Bearer {token}"
+    }
+    response = test_client.get("/movies", params={"cursor": "nope"}, headers=headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+def test_movie_cache_hits_and_invalidation(test_client, test_movie):
+    token = get_token()
+    headers = {
+        "Authorization": f"Bearer {token}"
+    }
+    test_client.post("/movies", json=dict(test_movie, category="CacheTest"), headers=headers)
+    id_movie = test_client.get("/movies", params={"category": "CacheTest"}, headers=headers).json()[0]["id"]
+    first = test_client.get("/movies/" + str(id_movie), headers=headers)
+    hits = movie_cache.stats()["hits"]
+    second = test_client.get("/movies/" + str(id_movie), headers=headers)
+    assert movie_cache.stats()["hits"] == hits + 1
+    assert first.content == second.content
+    assert test_client.get("/movies/category/CacheTest", headers=headers).status_code == status.HTTP_200_OK
+    # Moving the movie drops it and both category lists
+    test_client.put("/movies/" + str(id_movie), json=dict(test_movie, category="CacheMoved"), headers=headers)
+    assert test_client.get("/movies/" + str(id_movie), headers=headers).json()["category"] == "CacheMoved"
+    assert test_client.get("/movies/category/CacheTest", headers=headers).status_code == status.HTTP_404_NOT_FOUND
+    assert test_client.get("/movies/category/CacheMoved", headers=headers).json()[0]["id"] == id_movie
+    test_client.delete("/movies/" + str(id_movie), headers=headers)
+    assert test_client.get("/movies/" + str(id_movie), headers=headers).status_code == status.HTTP_404_NOT_FOUND
+    assert test_client.get("/movies/category/CacheMoved", headers=headers).status_code == status.HTTP_404_NOT_FOUND
+    response = test_client.get("/monitoring/cache", headers=headers)
+    assert set(response.json()) == {"size", "maxsize", "hits", "misses", "evictions"}
+
+def test_search_movies(test_client, test_movie):
+    token = get_token()
+    headers = {
+        "Authorization": f"Bearer {token}"
+    }
+    test_client.post("/movies", json=dict(test_movie, title="Matrix Search", overview="Hackers in a simulated world", category="SearchTest"), headers=headers)
+    test_client.post("/movies", json=dict(test_movie, title="Other Search", overview="A Matrix cameo somewhere here", category="SearchTest"), headers=headers)
+    response = test_client.get("/movies/search", params={"q": "matr"}, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert [i["title"] for i in response.json()][:2] == ["Matrix Search", "Other Search"]
+    response = test_client.get("/movies/search", params={"q": "matrix hack"}, headers=headers)
+    assert [i["title"] for i in response.json()] == ["Matrix Search"]
+    response = test_client.get("/movies/search", params={"q": "matrix", "limit": 1, "offset": 1}, headers=headers)
+    assert len(response.json()) == 1
+    id_movie = response.json()[0]["id"]
+    test_client.put("/movies/" + str(id_movie), json=dict(test_movie, title="Renamed Search", overview="Nothing to find in here", category="SearchTest"), headers=headers)
+    response = test_client.get("/movies/search", params={"q": "matrix"}, headers=headers)
+    assert id_movie not in [i["id"] for i in response.json()]
+    db = Session()
+    db.query(MovieModel).filter(MovieModel.category == "SearchTest").delete()
+    db.commit()
+    response = test_client.get("/movies/search", params={"q": "search"}, headers=headers)
+    assert [i for i in response.json() if i["category"] == "SearchTest"] == []
+
+def test_top_movies_and_facets(test_client, test_movie):
+    token = get_token()
+    headers = {
+        "Authorization": f"Bearer {token}"
+    }
+    # Loads the snapshot before the writes so they go through upsert/remove
+    test_client.get("/movies/top", headers=headers)
+    for year, rating in [(2001, 7.5), (2005, 9.1), (2005, 8.2), (2010, 9.1)]:
+        test_client.post("/movies", json=dict(test_movie, year=year, rating=rating, category="TopTest"), headers=headers)
+    response = test_client.get("/movies/top", params={"n": 3, "category": "TopTest"}, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    top = response.json()
+    assert [i["rating"] for i in top] == [9.1, 9.1, 8.2]
+    assert top[0]["id"] < top[1]["id"]
+    response = test_client.get("/movies/top", params={"category": "TopTest", "year_max": 2005, "rating_min": 8}, headers=headers)
+    assert [(i["year"], i["rating"]) for i in response.json()] == [(2005, 9.1), (2005, 8.2)]
+    response = test_client.get("/movies/facets", params={"field": "year", "category": "TopTest"}, headers=headers)
+    assert response.json() == {"2001": 1, "2005": 2, "2010": 1}
+    test_client.put("/movies/" + str(top[0]["id"]), json=dict(test_movie, year=2005, rating=5.0, category="TopMoved"), headers=headers)
+    test_client.delete("/movies/" + str(top[2]["id"]), headers=headers)
+    response = test_client.get("/movies/facets", params={"category": "TopMoved"}, headers=headers)
+    assert response.json() == {"TopMoved": 1}
+    response = test_client.get("/movies/facets", params={"field": "year", "category": "TopTest"}, headers=headers)
+    assert response.json() == {"2001": 1, "2010": 1}
+    assert test_client.get("/movies/facets", params={"field": "title"}, headers=headers).status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    for i in test_client.get("/movies/top", params={"category": "TopTest"}, headers=headers).json() + [top[0]]:
+        test_client.delete("/movies/" + str(i["id"]), headers=headers)
+
+def test_import_movies(test_client, test_movie):
+    token = get_token()
+    headers = {
+        "Authorization": f"Bearer {token}"
+    }
+    rows = [dict(test_movie, year=1990 + i, category="ImportTest") for i in range(5)]
+    rows.insert(2, dict(test_movie, rating=11, category="ImportTest"))
+    response = test_client.post("/movies/import", params={"chunk_size": 2}, json=rows, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    report = response.json()
+    assert (report["imported"], report["failed"]) == (5, 1)
+    assert report["errors"][0]["row"] == 3
+    assert report["errors"][0]["errors"][0]["loc"] == ["rating"]
+    assert report["rows_per_second"] > 0
+    imported = test_client.get("/movies/category/ImportTest", headers=headers).json()
+    assert sorted(i["year"] for i in imported) == [1990, 1991, 1992, 1993, 1994]
+    # Rows with an id replace the stored movie, the cached category list is dropped
+    body = "\n".join([
+        json.dumps(dict(test_movie, id=imported[0]["id"], title="Imported Again", category="ImportTest")),
+        "{not json",
+        json.dumps(dict(test_movie, category="ImportTest"))
+    ])
+    response = test_client.post("/movies/import", content=body, headers=dict(headers, **{"Content-Type": "application/x-ndjson"}))
+    assert (response.json()["imported"], response.json()["failed"]) == (2, 1)
+    assert response.json()["errors"][0]["row"] == 2
+    replaced = imported[0]["id"]
+    imported = test_client.get("/movies/category/ImportTest", headers=headers).json()
+    assert len(imported) == 6
+    assert [i["title"] for i in imported if i["id"] == replaced] == ["Imported Again"]
+    body = "title,overview,year,rating,category\n" + f"CSV Pelicula,{test_movie['overview']},2000,8.5,ImportTest\n" + "CSV Mala,corta,2000,8.5,ImportTest\n"
+    response = test_client.post("/movies/import", content=body.encode("utf-8"), headers=dict(headers, **{"Content-Type": "text/csv"}))
+    assert (response.json()["imported"], response.json()["failed"]) == (1, 1)
+    assert test_client.post("/movies/import", content="{}", headers=dict(headers, **{"Content-Type": "application/json"})).status_code == status.HTTP_400_BAD_REQUEST
+    assert test_client.post("/movies/import", content="x", headers=dict(headers, **{"Content-Type": "text/plain"})).status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    db = Session()
+    db.query(MovieModel).filter(MovieModel.category == "ImportTest").delete()
+    db.commit()
+
+def test_patch_movie(test_client, test_movie):
+    token = get_token()
+    headers = {
+        "Authorization": f"Bearer {token}"
+    }
+    test_client.get("/movies/top", headers=headers)
+    test_client.post("/movies", json=dict(test_movie, category="PatchTest", rating=5.0), headers=headers)
+    id_movie = test_client.get("/movies", params={"category": "PatchTest"}, headers=headers).json()[0]["id"]
+    test_client.get("/movies/" + str(id_movie), headers=headers)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        response = test_client.patch("/movies/" + str(id_movie), json={"rating": 6.5, "title": None}, headers=headers)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    assert response.status_code == status.HTTP_200_OK
+    movie_statements = [i for i in statements if "movies" in i]
+    assert len(movie_statements) == 1
+    assert movie_statements[0].startswith("UPDATE movies SET rating=?")
+    assert test_client.get("/movies/" + str(id_movie), headers=headers).json() == dict(test_movie, id=id_movie, category="PatchTest", rating=6.5)
+    assert test_client.get("/movies/top", params={"category": "PatchTest"}, headers=headers).json()[0]["rating"] == 6.5
+    assert test_client.patch("/movies/" + str(id_movie), json={}, headers=headers).status_code == status.HTTP_200_OK
+    assert test_client.patch("/movies/100000", json={"rating": 6.5}, headers=headers).status_code == status.HTTP_404_NOT_FOUND
+    assert test_client.patch("/movies/100000", json={}, headers=headers).status_code == status.HTTP_404_NOT_FOUND
+    assert test_client.patch("/movies/" + str(id_movie), json={"rating": 11}, headers=headers).status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    test_client.delete("/movies/" + str(id_movie), headers=headers)
+
+def test_conditional_get_movies(test_client, test_movie):
+    token = get_token()
+    headers = {
+        "Authorization": f"Bearer {token}"
+    }
+    test_client.post("/movies", json=dict(test_movie, category="EtagTest"), headers=headers)
+    id_movie = test_client.get("/movies", params={"category": "EtagTest"}, headers=headers).json()[0]["id"]
+    response = test_client.get("/movies/" + str(id_movie), headers=headers)
+    etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+    assert "version" not in response.json()
+    movie_cache.invalidate(id_movie)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        response = test_client.get("/movies/" + str(id_movie), headers=dict(headers, **{"If-None-Match": etag}))
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["etag"] == etag
+    assert [i for i in statements if "movies" in i] == [statements[-1]]
+    assert statements[-1].startswith("SELECT movies.version, movies.updated_at")
+    response = test_client.get("/movies/" + str(id_movie), headers=dict(headers, **{"If-Modified-Since": last_modified}))
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    test_client.patch("/movies/" + str(id_movie), json={"rating": 6.5}, headers=headers)
+    response = test_client.get("/movies/" + str(id_movie), headers=dict(headers, **{"If-None-Match": etag}))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["etag"] != etag
+    assert response.json()["rating"] == 6.5
+    # The list ETag follows any write to the table
+    response = test_client.get("/movies", params={"category": "EtagTest"}, headers=headers)
+    etag = response.headers["etag"]
+    response = test_client.get("/movies", params={"category": "EtagTest"}, headers=dict(headers, **{"If-None-Match": etag}))
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+    test_client.delete("/movies/" + str(id_movie), headers=headers)
+    response = test_client.get("/movies", params={"category": "EtagTest"}, headers=dict(headers, **{"If-None-Match": etag}))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == []
+    assert test_client.get("/movies/" + str(id_movie), headers=dict(headers, **{"If-None-Match": "*"})).status_code == status.HTTP_404_NOT_FOUND
+
+def test_movie_changes_feed(test_client, test_movie):
+    token = get_token()
+    headers = {
+        "Authorization": f"Bearer {token}"
+    }
+    db = Session()
+    since = db.query(func.max(MovieChangeModel.id)).scalar() or 0
+    db.close()
+    for title in ["Change One", "Change Two", "Change Three"]:
+        test_client.post("/movies", json=dict(test_movie, title=title, category="ChangeTest"), headers=headers)
+    ids = [i["id"] for i in test_client.get("/movies", params={"category": "ChangeTest"}, headers=headers).json()]
+    test_client.patch("/movies/" + str(ids[0]), json={"rating": 5.5}, headers=headers)
+    test_client.delete("/movies/" + str(ids[1]), headers=headers)
+    response = test_client.get("/movies/changes", params={"since": since}, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    feed = response.json()
+    assert feed["more"] is False
+    # One entry per movie, at its last change
+    assert [(i["id"], i["deleted"]) for i in feed["changes"]] == [(ids[2], False), (ids[0], False), (ids[1], True)]
+    assert feed["changes"][1]["movie"]["rating"] == 5.5
+    assert feed["changes"][2]["movie"] is None
+    assert feed["cursor"] == feed["changes"][-1]["cursor"]
+    # Batches pick up at the returned cursor
+    seen, cursor, more = [], since, True
+    while more:
+        batch = test_client.get("/movies/changes", params={"since": cursor, "limit": 2}, headers=headers).json()
+        assert len(batch["changes"]) <= 2
+        seen += [(i["id"], i["deleted"]) for i in batch["changes"]]
+        cursor, more = batch["cursor"], batch["more"]
+    assert cursor == feed["cursor"]
+    assert seen[-1] == (ids[1], True)
+    response = test_client.get("/movies/changes", params={"since": cursor}, headers=headers)
+    assert response.json() == {"changes": [], "cursor": cursor, "more": False}
+    for id_movie in ids:
+        test_client.delete("/movies/" + str(id_movie), headers=headers)
@@ -0,0 +1,251 @@
+import threading
+from fastapi.testclient import TestClient
+from security import app
+from fastapi import status
+from sqlalchemy import event
+from config.dabatase import Session, async_engine
+from services.user import UserService
+from services.movie import MovieService
+from schemas.movie import Movie, MovieCreated
+from utils.idempotency import idempotency_store, request_fingerprint
+import pytest
+
+credentials = {"username": "pruebaorder", "password": "prueba", "email": "pruebaorder@gmail.com"}
+
+movie = {
+        "title": "Test Pelicula",
+        "overview": "Descripción de la película",
+        "year": 2022,
+        "rating": 9.8,
+        "category": "OrderTest"
+        }
+
+@pytest.fixture(scope="module")
+def test_client():
+    client = TestClient(app)
+    client.post("/signup", json=credentials)
+    yield client
+    db = Session()
+    UserService(db).delete_user_by_email(credentials["email"])
+
+@pytest.fixture(scope="module")
+def id_user(test_client):
+    return UserService(Session()).get_user_by_username(credentials["username"]).id
+
+@pytest.fixture(scope="module")
+def id_movie(test_client):
+    db = Session()
+    new_movie = MovieService(db).create_movie(Movie(**movie))
+    yield new_movie.id
+    MovieService(db).delete_movie(new_movie.id)
+
+@pytest.fixture(scope="module")
+def id_movie_2(test_client):
+    db = Session()
+    new_movie = MovieService(db).create_movie(Movie(**movie))
+    yield new_movie.id
+    MovieService(db).delete_movie(new_movie.id)
+
+def get_order_id(test_client, id_user):
+    orders = test_client.get("/orders", params={"user_id": id_user, "sort": "-id", "limit": 1}).json()
+    return orders[0]["id"]
+
+def test_create_order_successfully(test_client, id_user, id_movie):
+    body = [dict(movie, id=id_movie, quantity=2)]
+    response = test_client.post("/orders/" + str(id_user), json=body)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json() == {"message": "Order Created"}
+
+def test_create_order_user_not_found(test_client, id_movie):
+    body = [dict(movie, id=id_movie, quantity=2)]
+    response = test_client.post("/orders/100000", json=body)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": "User not found"}
+
+def test_get_order_movies(test_client, id_user, id_movie):
+    id_order = get_order_id(test_client, id_user)
+    response = test_client.get("/orders/movies/" + str(id_order))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()[0]["id"] == id_movie
+    assert response.json()[0]["quantity"] == 2
+
+def test_get_order_movies_single_query(test_client, id_user, id_movie):
+    id_order = get_order_id(test_client, id_user)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        response = test_client.get("/orders/movies/" + str(id_order))
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(statements) == 1
+
+def test_get_order_include_movies(test_client, id_user, id_movie):
+    id_order = get_order_id(test_client, id_user)
+    response = test_client.get("/orders/" + str(id_order), params={"include": "movies"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["id"] == id_order
+    assert response.json()["movies"][0]["id"] == id_movie
+    assert response.json()["movies"][0]["quantity"] == 2
+
+def test_get_order_movies_not_found(test_client):
+    response = test_client.get("/orders/movies/100000")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+def test_update_order_successfully(test_client, id_user, id_movie):
+    id_order = get_order_id(test_client, id_user)
+    body = [dict(movie, id=id_movie, quantity=5)]
+    response = test_client.put("/orders/" + str(id_order), json=body)
+    assert response.status_code == status.HTTP_200_OK
+    response = test_client.get("/orders/movies/" + str(id_order))
+    assert response.json()[0]["quantity"] == 5
+
+def test_update_order_diffs_lines(test_client, id_user, id_movie, id_movie_2):
+    id_order = get_order_id(test_client, id_user)
+    body = [dict(movie, id=id_movie_2, quantity=1), dict(movie, id=id_movie_2, quantity=2)]
+    response = test_client.put("/orders/" + str(id_order), json=body)
+    assert response.status_code == status.HTTP_200_OK
+    response = test_client.get("/orders/movies/" + str(id_order))
+    assert [(i["id"], i["quantity"]) for i in response.json()] == [(id_movie_2, 3)]
+
+def test_conditional_get_order(test_client, id_user, id_movie, id_movie_2):
+    id_order = get_order_id(test_client, id_user)
+    response = test_client.get("/orders/" + str(id_order))
+    etag = response.headers["etag"]
+    assert set(response.json()) == {"id", "date_created", "user_id"}
+    response = test_client.get("/orders/" + str(id_order), headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    response = test_client.get("/orders/" + str(id_order), params={"include": "movies"})
+    included = response.headers["etag"]
+    assert included != etag
+    # Changing the lines moves the order's version
+    test_client.put("/orders/" + str(id_order), json=[dict(movie, id=id_movie, quantity=1)])
+    response = test_client.get("/orders/" + str(id_order), headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["etag"]
+    response = test_client.get("/orders/" + str(id_order), params={"include": "movies"}, headers={"If-None-Match": included})
+    assert response.status_code == status.HTTP_200_OK
+    included = response.headers["etag"]
+    # Embedded movies changing is enough for the include=movies ETag
+    MovieService(Session()).update_movie(id_movie, Movie(**dict(movie, title="Changed")))
+    assert test_client.get("/orders/" + str(id_order), headers={"If-None-Match": etag}).status_code == status.HTTP_304_NOT_MODIFIED
+    response = test_client.get("/orders/" + str(id_order), params={"include": "movies"}, headers={"If-None-Match": included})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["movies"][0]["title"] == "Changed"
+
+def test_create_order_idempotency_key(test_client, id_user, id_movie):
+    orders = len(test_client.get("/orders", params={"user_id": id_user}).json())
+    body = [dict(movie, id=id_movie, quantity=2)]
+    headers = {"Idempotency-Key": f"order-{id_user}-retry"}
+    response = test_client.post("/orders/" + str(id_user), json=body, headers=headers)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert "idempotent-replayed" not in response.headers
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        retry = test_client.post("/orders/" + str(id_user), json=body, headers=headers)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    assert retry.status_code == status.HTTP_201_CREATED
+    assert retry.json() == response.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert statements == []
+    assert len(test_client.get("/orders", params={"user_id": id_user}).json()) == orders + 1
+    response = test_client.post("/orders/" + str(id_user), json=[dict(movie, id=id_movie, quantity=3)], headers=headers)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    # Failures are not stored, the retry runs again
+    missing = {"Idempotency-Key": f"order-{id_user}-missing"}
+    assert test_client.post("/orders/100000", json=body, headers=missing).status_code == status.HTTP_404_NOT_FOUND
+    assert test_client.post("/orders/100000", json=body, headers=missing).status_code == status.HTTP_404_NOT_FOUND
+    # A duplicate of a request still running
+    busy = f"order-{id_user}-busy"
+    idempotency_store.begin(busy, request_fingerprint(id_user, [MovieCreated(**i).dict() for i in body]))
+    try:
+        response = test_client.post("/orders/" + str(id_user), json=body, headers={"Idempotency-Key": busy})
+        assert response.status_code == status.HTTP_409_CONFLICT
+    finally:
+        idempotency_store.abort(busy)
+    assert len(test_client.get("/orders", params={"user_id": id_user}).json()) == orders + 1
+
+def test_update_order_movie_not_found(test_client, id_user):
+    id_order = get_order_id(test_client, id_user)
+    body = [dict(movie, id=100000, quantity=1)]
+    response = test_client.put("/orders/" + str(id_order), json=body)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": "Movie not found"}
+
+def test_create_order_movie_not_found(test_client, id_user, id_movie):
+    orders = len(test_client.get("/orders", params={"user_id": id_user}).json())
+    body = [dict(movie, id=id_movie, quantity=1), dict(movie, id=100000, quantity=1)]
+    response = test_client.post("/orders/" + str(id_user), json=body)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": "Movie not found"}
+    assert len(test_client.get("/orders", params={"user_id": id_user}).json()) == orders
+
+def test_create_order_single_transaction(test_client, id_user, id_movie, id_movie_2):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    body = [dict(movie, id=id_movie, quantity=1), dict(movie, id=id_movie_2, quantity=4)]
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        response = test_client.post("/orders/" + str(id_user), json=body)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert len([i for i in statements if i.startswith("INSERT INTO order_movies")]) == 1
+    id_order = get_order_id(test_client, id_user)
+    response = test_client.get("/orders/movies/" + str(id_order))
+    assert sorted((i["id"], i["quantity"]) for i in response.json()) == [(id_movie, 1), (id_movie_2, 4)]
+
+def test_get_orders_keyset_pages(test_client, id_user):
+    ids = [i["id"] for i in test_client.get("/orders", params={"user_id": id_user}).json()]
+    assert len(ids) >= 2
+    response = test_client.get("/orders", params={"user_id": id_user, "limit": 1, "sort": "date_created"})
+    seen = [i["id"] for i in response.json()]
+    while "X-Next-Cursor" in response.headers:
+        params = {"user_id": id_user, "limit": 1, "sort": "date_created", "cursor": response.headers["X-Next-Cursor"]}
+        response = test_client.get("/orders", params=params)
+        seen += [i["id"] for i in response.json()]
+    assert seen == sorted(ids)
+
+def test_delete_order_successfully(test_client, id_user):
+    id_order = get_order_id(test_client, id_user)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        response = test_client.delete("/orders/" + str(id_order))
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"message": "Order removed"}
+    # No read before the write, the lines go with the order
+    assert [i.split()[0] for i in statements] == ["DELETE", "DELETE"]
+    response = test_client.get("/orders/" + str(id_order))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert test_client.get("/orders/movies/" + str(id_order)).status_code == status.HTTP_404_NOT_FOUND
+    assert test_client.delete("/orders/" + str(id_order)).status_code == status.HTTP_404_NOT_FOUND
+
+def test_update_missing_order(test_client, id_movie):
+    response = test_client.put("/orders/100000", json=[dict(movie, id=id_movie, quantity=1)])
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json()["detail"] == "Order not found"
+
+def test_no_database_threads_left_behind(test_client):
+    test_client.get("/orders")
+    alive = [t for t in threading.enumerate() if "_connection_worker_thread" in t.name and not t.daemon]
+    assert alive == []
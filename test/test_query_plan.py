@@ -0,0 +1,60 @@
+from sqlalchemy import create_engine, inspect, text
+from fastapi.testclient import TestClient
+from security import app
+from config.dabatase import Session, engine, async_engine
+from services.user import UserService
+from utils.query_plan import QueryPlanRecorder
+from config.migrations import migrate
+
+credentials = {"username": "pruebaplan", "password": "prueba", "email": "pruebaplan@gmail.com"}
+
+movie = {
+        "title": "Test Pelicula",
+        "overview": "Descripción de la película",
+        "year": 2022,
+        "rating": 9.8,
+        "category": "PlanTest"
+        }
+
+def test_service_queries_use_indexes():
+    client = TestClient(app)
+    with QueryPlanRecorder(engine, async_engine) as recorder:
+        client.post("/signup", json=credentials)
+        tokens = client.post("/login", json={"username": credentials["username"], "password": credentials["password"]}).json()
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        client.post("/refresh", json={"refresh_token": tokens["refresh_token"]})
+        client.post("/movies", json=movie, headers=headers)
+        id_movie = client.get("/movies", params={"category": "PlanTest"}, headers=headers).json()[0]["id"]
+        for params in ({}, {"sort": "-rating"}, {"sort": "year", "year_min": 2000}, {"category": "PlanTest", "sort": "-rating"}):
+            client.get("/movies", params=params, headers=headers)
+        client.get("/movies/" + str(id_movie), headers=headers)
+        client.get("/movies/category/PlanTest", headers=headers)
+        client.get("/movies/search", params={"q": "pelic"}, headers=headers)
+        client.put("/movies/" + str(id_movie), json=movie, headers=headers)
+        id_user = UserService(Session()).get_user_by_username(credentials["username"]).id
+        client.post("/orders/" + str(id_user), json=[dict(movie, id=id_movie, quantity=1)])
+        id_order = client.get("/orders", params={"user_id": id_user}).json()[0]["id"]
+        client.get("/orders", params={"sort": "-date_created"})
+        client.get("/orders/" + str(id_order), params={"include": "movies"})
+        client.get("/orders/movies/" + str(id_order))
+        client.put("/orders/" + str(id_order), json=[dict(movie, id=id_movie, quantity=2)])
+        client.delete("/orders/" + str(id_order))
+        client.delete("/movies/" + str(id_movie), headers=headers)
+        client.put("/users/" + str(id_user), json=credentials, headers=headers)
+        UserService(Session()).delete_user_by_email(credentials["email"])
+    with engine.connect() as connection:
+        assert recorder.full_scans(connection) == []
+
+def test_migrate_creates_missing_indexes(tmp_path):
+    old_engine = create_engine(f"sqlite:///{tmp_path / 'old.sqlite'}")
+    with old_engine.begin() as connection:
+        connection.execute(text("CREATE TABLE movies (id INTEGER PRIMARY KEY, title VARCHAR, overview VARCHAR, year INTEGER, rating FLOAT, category VARCHAR)"))
+        connection.execute(text("INSERT INTO movies (title, overview) VALUES ('Old Movie', 'Stored before search existed')"))
+        connection.execute(text("CREATE TABLE order_movies (order_id INTEGER, movie_id INTEGER, quantity INTEGER, PRIMARY KEY (order_id, movie_id))"))
+    migrate(old_engine)
+    inspector = inspect(old_engine)
+    assert "ix_movies_category_id" in [i["name"] for i in inspector.get_indexes("movies")]
+    assert "ix_order_movies_movie_id" in [i["name"] for i in inspector.get_indexes("order_movies")]
+    with old_engine.connect() as connection:
+        assert connection.execute(text("SELECT rowid FROM movies_fts WHERE movies_fts MATCH 'stored'")).all() == [(1,)]
+
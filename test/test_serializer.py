@@ -0,0 +1,77 @@
+from security import app
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
+from config.dabatase import Session
+from models.movie import Movie as MovieModel
+from models.order import Order as OrderModel, OrderMovie as OrderMovieModel
+from models.user import User as UserModel
+from schemas.movie import MovieCreated
+from utils.serializer import dumps, FastJSONResponse
+from datetime import date
+import pytest
+
+def render(content) -> bytes:
+    return JSONResponse(content=jsonable_encoder(content)).body
+
+def columns(obj) -> dict:
+    hidden = getattr(obj, "hidden_columns", ())
+    return {c.name: obj.__dict__[c.name] for c in obj.__table__.columns if c.name in obj.__dict__ and c.name not in hidden}
+
+@pytest.fixture(scope="module")
+def rows():
+    db = Session()
+    user = UserModel(username="pruebaserial", email="pruebaserial@gmail.com", password="x")
+    db.add(user)
+    db.flush()
+    movies = [
+        MovieModel(title="Serial Ñandú", overview="Descripción con acentos  ", year=2001, rating=9.8, category="SerialTest"),
+        MovieModel(title="Serial Two", overview=None, year=None, rating=1e-5, category="SerialTest"),
+        MovieModel(title="Serial Three", overview="Huge", year=1, rating=1e17, category="SerialTest")
+    ]
+    db.add_all(movies)
+    db.flush()
+    order = OrderModel(user_id=user.id, date_created=date(2023, 5, 17))
+    db.add(order)
+    db.flush()
+    # Lines left behind by deleted orders would collide with the reused id
+    db.query(OrderMovieModel).filter(OrderMovieModel.order_id == order.id).delete()
+    db.add(OrderMovieModel(order_id=order.id, movie_id=movies[0].id, quantity=3))
+    id_user, id_order = user.id, order.id
+    db.commit()
+    db.close()
+    db = Session()
+    yield db
+    db.rollback()
+    db.query(MovieModel).filter(MovieModel.category == "SerialTest").delete()
+    db.query(OrderMovieModel).filter(OrderMovieModel.order_id == id_order).delete()
+    db.query(OrderModel).filter(OrderModel.id == id_order).delete()
+    db.query(UserModel).filter(UserModel.id == id_user).delete()
+    db.commit()
+    db.close()
+
+def test_orm_rows_match_json_response(rows):
+    movies = rows.execute(select(MovieModel).where(MovieModel.category == "SerialTest").order_by(MovieModel.id)).scalars().all()
+    # Same bytes as JSONResponse, with the keys in column order
+    assert dumps(movies) == render([columns(i) for i in movies])
+    assert dumps(movies[0]) == render(columns(movies[0]))
+    order = rows.execute(select(OrderModel).join(OrderMovieModel).where(OrderMovieModel.movie_id == movies[0].id)).scalars().first()
+    assert dumps(order) == render(columns(order))
+    lines = rows.execute(select(OrderMovieModel).where(OrderMovieModel.order_id == order.id)).scalars().all()
+    assert dumps(lines) == render([columns(i) for i in lines])
+    created = MovieCreated(id=1, title="Serial Ñandú", overview="Descripción de la película", year=2000, rating=7.25, quantity=2, category="SerialTest")
+    assert dumps([created]) == render([created])
+    assert dumps({"id": 1, "movies": [created], "date": date(2020, 1, 2)}) == render({"id": 1, "movies": [created], "date": date(2020, 1, 2)})
+
+def test_edge_values_match_json_response():
+    for content in [1e16, 1.5e-5, -0.0, 0.0001, 123456789.123, 2 ** 70, {1: "a"}, {"a": {1, 2}}, "ü \x7f", [None, True]]:
+        assert dumps(content) == render(content)
+
+def test_column_rows_and_unloaded_attributes(rows):
+    row = rows.execute(select(MovieModel.id, MovieModel.title).where(MovieModel.category == "SerialTest")).first()
+    assert dumps(row) == dumps({"id": row.id, "title": row.title})
+    movie = rows.execute(select(MovieModel).where(MovieModel.category == "SerialTest")).scalars().first()
+    rows.expire(movie, ["overview"])
+    assert b"overview" not in dumps(movie)
+    assert dumps(movie) == render(columns(movie))
+    assert FastJSONResponse(content=[movie]).body == render([columns(movie)])
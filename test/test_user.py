@@ -4,14 +4,24 @@ from fastapi import status
 from schemas.user import UserSingUp
 from config.dabatase import Session
 from services.user import UserService
+import asyncio
+from fastapi import HTTPException
+from utils.password_hasher import password_hasher, PasswordHasher
 import pytest
-from utils.jwt_manager import create_token
+import time
+from datetime import datetime, timedelta, timezone
+from jwt import encode
+from sqlalchemy import create_engine, inspect, text
+from config.migrations import migrate
+from models.user import User as UserModel
+from services.user import token_version_cache
 
 credentials = {"username": "prueba", "password": "prueba", "email": "prueba@gmail.com"}
 
 def get_token():
-    token = create_token(credentials)
-    return token
+    data = {"username": credentials["username"], "password": credentials["password"]}
+    response = TestClient(app).post("/login", json=data)
+    return response.json()["access_token"]
 
 @pytest.fixture(scope="module")
 def test_client():
@@ -40,6 +50,50 @@ def test_login_user(test_client, test_user):
     response = test_client.post("/login", json=data)
     assert response.status_code == status.HTTP_200_OK
 
+def test_login_rejected_when_hasher_saturated(test_client, test_user):
+    data = {"username": test_user["username"], "password":test_user["password"]}
+    pending = password_hasher.pending
+    password_hasher.pending = password_hasher.max_pending
+    try:
+        response = test_client.post("/login", json=data)
+    finally:
+        password_hasher.pending = pending
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "1"
+
+def test_login_wrong_password(test_client, test_user):
+    data = {"username": test_user["username"], "password": "incorrecta"}
+    response = test_client.post("/login", json=data)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+def test_password_hasher_backpressure():
+    hasher = PasswordHasher(max_workers=1, max_queue=1)
+    ticks = []
+
+    async def ticker():
+        while len(ticks) < 1000:
+            ticks.append(hasher.pending)
+            await asyncio.sleep(0.001)
+
+    async def burst():
+        task = asyncio.create_task(ticker())
+        hashed = await hasher.hash("prueba")
+        results = await asyncio.gather(
+            hasher.verify("prueba", hashed),
+            hasher.hash("prueba"),
+            hasher.verify("prueba", hashed),
+            return_exceptions=True)
+        task.cancel()
+        return results
+
+    results = asyncio.run(burst())
+    rejected = [i for i in results if isinstance(i, HTTPException)]
+    assert len(rejected) == 1 and rejected[0].status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert results[0] is True
+    # The event loop kept running while bcrypt worked on the pool
+    assert any(i > 0 for i in ticks)
+    assert hasher.pending == 0
+
 def test_delete_user_not_found(test_client):
     token = get_token()
     headers = {
@@ -66,3 +120,67 @@ def test_update_access_forbidden(test_client, test_user):
     response = test_client.put("/users/2000", json=test_user)
     assert response.status_code == status.HTTP_403_FORBIDDEN
 
+
+
+def test_refresh_token(test_client, test_user):
+    data = {"username": test_user["username"], "password":test_user["password"]}
+    tokens = test_client.post("/login", json=data).json()
+    response = test_client.post("/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == status.HTTP_200_OK
+    assert "access_token" in response.json()
+    response = test_client.post("/refresh", json={"refresh_token": tokens["access_token"]})
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+def test_logout_revokes_tokens(test_client):
+    token = get_token()
+    headers = {
+        "Authorization": f"Bearer {token}"
+    }
+    response = test_client.post("/logout", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    response = test_client.delete("/users/2000", headers=headers)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_expired_token_rejected(test_client, test_user):
+    user = UserService(Session()).get_user_by_username(test_user["username"])
+    data = {"sub": str(user.id), "ver": user.token_version, "type": "access", "exp": datetime.now(timezone.utc) - timedelta(seconds=1)}
+    headers = {
+        "Authorization": f"Bearer {encode(data, key='my_secret_key', algorithm='HS256')}"
+    }
+    response = test_client.delete("/users/2000", headers=headers)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+def test_token_without_version_rejected(test_client, test_user):
+    user = UserService(Session()).get_user_by_username(test_user["username"])
+    data = {"sub": str(user.id), "type": "access", "exp": datetime.now(timezone.utc) + timedelta(minutes=1)}
+    headers = {
+        "Authorization": f"Bearer {encode(data, key='my_secret_key', algorithm='HS256')}"
+    }
+    response = test_client.delete("/users/2000", headers=headers)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+def test_revocation_from_other_worker_seen_after_ttl(test_client, test_user, monkeypatch):
+    token = get_token()
+    headers = {
+        "Authorization": f"Bearer {token}"
+    }
+    assert test_client.delete("/users/2000", headers=headers).status_code == status.HTTP_404_NOT_FOUND
+    # Another worker bumps the version without touching this worker's cache
+    db = Session()
+    db.query(UserModel).filter(UserModel.username == test_user["username"]).update({UserModel.token_version: UserModel.token_version + 1})
+    db.commit()
+    now = time.monotonic()
+    monkeypatch.setattr("utils.cache.time.monotonic", lambda: now + token_version_cache.ttl + 1)
+    assert test_client.delete("/users/2000", headers=headers).status_code == status.HTTP_403_FORBIDDEN
+
+def test_migrate_adds_token_version(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.sqlite'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR, password VARCHAR, email VARCHAR)"))
+        connection.execute(text("INSERT INTO users (username) VALUES ('old')"))
+    migrate(engine)
+    migrate(engine)
+    assert "token_version" in [i["name"] for i in inspect(engine).get_columns("users")]
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT token_version FROM users")).scalar() == 0
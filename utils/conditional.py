@@ -0,0 +1,37 @@
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Response, status
+
+def make_etag(*parts) -> str:
+    return '"' + "-".join(str(i) for i in parts) + '"'
+
+def latest(*moments):
+    moments = [i for i in moments if i is not None]
+    return max(moments) if moments else None
+
+def validator_headers(etag: str, last_modified=None) -> dict:
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        # Stored as naive UTC
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+    return headers
+
+def is_not_modified(headers, etag: str, last_modified=None) -> bool:
+    # If-None-Match wins over If-Modified-Since when both are sent (RFC 9110 13.2.2)
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [i.strip() for i in if_none_match.split(",")]
+        return "*" in tags or etag in tags or "W/" + etag in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+def not_modified_response(etag: str, last_modified=None) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validator_headers(etag, last_modified))
@@ -0,0 +1,131 @@
+import asyncio
+import os
+from collections import deque
+from threading import Lock
+from utils.serializer import dumps
+
+class Subscriber():
+
+    def __init__(self, loop, topics, maxsize: int) -> None:
+        self.loop = loop
+        self.topics = topics
+        self.queue = asyncio.Queue(maxsize)
+        self.evicted = False
+
+    def wants(self, event) -> bool:
+        return not self.topics or event[1].split(".")[0] in self.topics
+
+    def deliver(self, events) -> None:
+        # Runs on the subscriber's loop
+        for event in events:
+            if self.evicted:
+                return
+            if not self.wants(event):
+                continue
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too far behind, the stream ends and the client resumes from Last-Event-ID
+                self.evicted = True
+
+class EventBus():
+
+    # In-process pub/sub for server-sent events. Every event is encoded once as an SSE frame
+    # and kept in a bounded history for Last-Event-ID resume.
+    def __init__(self, queue_size: int, history: int) -> None:
+        self.queue_size = queue_size
+        self.history = deque(maxlen=history)
+        self.last_id = 0
+        self.published = 0
+        self.evicted = 0
+        self._loops = {}
+        self._lock = Lock()
+
+    def publish(self, name: str, data: dict) -> None:
+        # Safe from any thread, the sync services run in the threadpool
+        with self._lock:
+            self.last_id += 1
+            self.published += 1
+            frame = b"id: %d\nevent: %s\ndata: %s\n\n" % (self.last_id, name.encode(), dumps(data))
+            event = (self.last_id, name, frame)
+            self.history.append(event)
+            loops = [(loop, list(subscribers)) for loop, subscribers in self._loops.items()]
+        # One callback per event loop, not per subscriber
+        for loop, subscribers in loops:
+            try:
+                loop.call_soon_threadsafe(self._deliver, subscribers, [event])
+            except RuntimeError:
+                pass
+
+    def _deliver(self, subscribers, events) -> None:
+        for subscriber in subscribers:
+            was_evicted = subscriber.evicted
+            subscriber.deliver(events)
+            if subscriber.evicted and not was_evicted:
+                with self._lock:
+                    self.evicted += 1
+
+    def subscribe(self, topics=None, last_event_id: int | None = None):
+        # Returns the subscriber and the events it missed, None when they are no longer in the history
+        subscriber = Subscriber(asyncio.get_running_loop(), set(topics or ()), self.queue_size)
+        with self._lock:
+            self._loops.setdefault(subscriber.loop, set()).add(subscriber)
+            missed = []
+            if last_event_id is not None:
+                oldest = self.history[0][0] if self.history else self.last_id + 1
+                # A gap, or an id from before a restart
+                if last_event_id < oldest - 1 or last_event_id > self.last_id:
+                    missed = None
+                else:
+                    missed = [i for i in self.history if i[0] > last_event_id and subscriber.wants(i)]
+        return subscriber, missed
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            subscribers = self._loops.get(subscriber.loop)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._loops[subscriber.loop]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "subscribers": sum(len(i) for i in self._loops.values()),
+                "published": self.published,
+                "evicted": self.evicted,
+                "last_id": self.last_id,
+                "history": len(self.history)
+            }
+
+    async def stream(self, topics=None, last_event_id: int | None = None, heartbeat: float = 15):
+        subscriber, missed = self.subscribe(topics, last_event_id)
+        getter = None
+        try:
+            if missed is None:
+                # Missed events are gone, the client has to resync (GET /movies/changes)
+                yield b"event: reset\ndata: {}\n\n"
+            # Straight from the history, they are older than anything in the queue
+            for event in missed or ():
+                yield event[2]
+            while True:
+                if getter is None:
+                    getter = asyncio.ensure_future(subscriber.queue.get())
+                # Not wait_for, a timeout there can drop the item it was about to return
+                done, _ = await asyncio.wait({getter}, timeout=heartbeat)
+                if not done:
+                    yield b": keepalive\n\n"
+                    continue
+                event, getter = getter.result(), None
+                if subscriber.evicted:
+                    yield b"event: evicted\ndata: {}\n\n"
+                    return
+                yield event[2]
+        finally:
+            if getter is not None:
+                getter.cancel()
+            self.unsubscribe(subscriber)
+
+event_bus = EventBus(
+    queue_size=int(os.getenv("EVENT_QUEUE_SIZE", 256)),
+    history=int(os.getenv("EVENT_HISTORY", 10000)))
@@ -0,0 +1,43 @@
+import hashlib
+import json
+import os
+from threading import Lock
+from utils.cache import TTLCache
+
+def request_fingerprint(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+class IdempotencyStore():
+
+    # Responses of recent requests by Idempotency-Key, plus the keys still being processed
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.in_flight = {}
+        self._lock = Lock()
+
+    def begin(self, key: str, fingerprint: str):
+        # ("new", None), ("replay", (status_code, body)), ("in_flight", None) or ("mismatch", None)
+        with self._lock:
+            stored = self.cache.get(key)
+            if stored is not None:
+                if stored[0] != fingerprint:
+                    return "mismatch", None
+                return "replay", stored[1:]
+            if key in self.in_flight:
+                return ("in_flight" if self.in_flight[key] == fingerprint else "mismatch"), None
+            self.in_flight[key] = fingerprint
+            return "new", None
+
+    def finish(self, key: str, fingerprint: str, status_code: int, body: bytes) -> None:
+        with self._lock:
+            self.in_flight.pop(key, None)
+            self.cache.set(key, (fingerprint, status_code, body))
+
+    def abort(self, key: str) -> None:
+        # Nothing stored, a retry runs again
+        with self._lock:
+            self.in_flight.pop(key, None)
+
+idempotency_store = IdempotencyStore(
+    maxsize=int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000)),
+    ttl=float(os.getenv("IDEMPOTENCY_TTL", 86400)))
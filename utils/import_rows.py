@@ -0,0 +1,30 @@
+import csv
+import io
+import json
+
+import_media_types = ("application/json", "application/x-ndjson", "text/csv")
+
+def read_rows(body: bytes, media_type: str):
+    # Yields (row number, row, decode error) for every row of the upload
+    text = body.decode("utf-8-sig")
+    if media_type == "application/json":
+        rows = json.loads(text)
+        if not isinstance(rows, list):
+            raise ValueError("Expected a JSON array")
+        for number, row in enumerate(rows, start=1):
+            yield number, row, None
+    elif media_type == "application/x-ndjson":
+        number = 0
+        for line in io.StringIO(text):
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, None, str(e)
+                continue
+            yield number, row, None
+    else:
+        for number, row in enumerate(csv.DictReader(io.StringIO(text)), start=1):
+            yield number, {k: v for k, v in row.items() if v != ""}, None
@@ -1,18 +1,32 @@
+from datetime import datetime, timedelta, timezone
 from jwt import encode, decode
+from jwt.exceptions import InvalidTokenError
 from passlib.context import CryptContext
 
-def create_token(data: dict):
+ACCESS_TOKEN_EXPIRES = timedelta(minutes=15)
+REFRESH_TOKEN_EXPIRES = timedelta(days=7)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def create_token(user_id: int, token_version: int, token_type: str = "access"):
+    expires = ACCESS_TOKEN_EXPIRES if token_type == "access" else REFRESH_TOKEN_EXPIRES
+    data = {
+        "sub": str(user_id),
+        "ver": token_version,
+        "type": token_type,
+        "exp": datetime.now(timezone.utc) + expires
+    }
     token: str = encode(payload=data, key="my_secret_key", algorithm="HS256")
     return token
 
-def validate_token(token: str):
-    data: dict = decode(token, key="my_secret_key", algorithms=['HS256'])
+def validate_token(token: str, token_type: str = "access"):
+    data: dict = decode(token, key="my_secret_key", algorithms=['HS256'], options={"require": ["exp", "sub", "ver", "type"]})
+    if data.get("type") != token_type:
+        raise InvalidTokenError("Invalid token type")
     return data
 
 def get_password_hash(password):
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
     return pwd_context.hash(password)
 
 def verify_password(plain_password, hashed_password):
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password, hashed_password)
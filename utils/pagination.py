@@ -0,0 +1,42 @@
+import base64
+import json
+from datetime import date
+from sqlalchemy import Date, tuple_
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError("Invalid cursor")
+    return values
+
+def keyset(statement, column, id_column, descending: bool, cursor: str | None, limit: int):
+    # Seek past the last (sort value, id) seen instead of using OFFSET
+    if cursor:
+        after = decode_cursor(cursor)
+        if isinstance(column.type, Date):
+            after[0] = date.fromisoformat(after[0])
+        if column is id_column:
+            key, after = id_column, after[1]
+        else:
+            key, after = tuple_(column, id_column), tuple(after)
+        statement = statement.where(key < after if descending else key > after)
+    order = [column] if column is id_column else [column, id_column]
+    if descending:
+        order = [i.desc() for i in order]
+    statement = statement.order_by(*order)
+    return statement.limit(limit + 1)
+
+def next_page(rows: list, column_name: str, limit: int):
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    value = getattr(last, column_name)
+    if isinstance(value, date):
+        value = value.isoformat()
+    return rows[:limit], encode_cursor([value, last.id])
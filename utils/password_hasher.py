@@ -0,0 +1,35 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, status
+from utils.jwt_manager import get_password_hash, verify_password
+
+class PasswordHasher():
+
+    def __init__(self, max_workers: int, max_queue: int) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self.max_pending = max_workers + max_queue
+        self.pending = 0
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._submit(verify_password, plain_password, hashed_password)
+
+    async def _submit(self, function, *args):
+        # Only touched from the event loop, so the counter needs no lock
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many login attempts in progress",
+                headers={"Retry-After": "1"})
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            self.pending -= 1
+
+password_hasher = PasswordHasher(
+    max_workers=int(os.getenv("HASHER_WORKERS", os.cpu_count() or 1)),
+    max_queue=int(os.getenv("HASHER_QUEUE", 64)))
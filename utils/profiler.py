@@ -0,0 +1,90 @@
+import sys
+import time
+from collections import Counter
+from threading import Lock, Thread, get_ident
+
+class Profiler():
+
+    # Statistical sampler. While a profiled request runs, a thread looks at the stack of every
+    # thread and keeps the ones that pass through the route's endpoint, as collapsed stacks.
+    def __init__(self) -> None:
+        self.armed = {}
+        self.stacks = {}
+        self.profiled = Counter()
+        self.interval = 0.005
+        self._active = Counter()
+        self._thread = None
+        self._lock = Lock()
+
+    def arm(self, key, requests: int, interval: float) -> None:
+        with self._lock:
+            self.armed[key] = requests
+            self.interval = interval
+            self.stacks[key] = Counter()
+            self.profiled[key] = 0
+
+    def take(self, key) -> bool:
+        # Claims one of the armed requests for this route
+        with self._lock:
+            remaining = self.armed.get(key, 0)
+            if remaining <= 0:
+                return False
+            if remaining == 1:
+                del self.armed[key]
+            else:
+                self.armed[key] = remaining - 1
+            self.profiled[key] += 1
+            return True
+
+    def begin(self, key, code) -> None:
+        with self._lock:
+            self._active[(key, code)] += 1
+            if self._thread is None:
+                self._thread = Thread(target=self._sample, name="profiler-sampler", daemon=True)
+                self._thread.start()
+
+    def end(self, key, code) -> None:
+        with self._lock:
+            self._active[(key, code)] -= 1
+            if self._active[(key, code)] <= 0:
+                del self._active[(key, code)]
+
+    def _sample(self) -> None:
+        own = get_ident()
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                targets = {code: key for key, code in self._active}
+                interval = self.interval
+            for thread, frame in sys._current_frames().items():
+                if thread == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame)
+                    key = targets.get(frame.f_code)
+                    if key is not None:
+                        collapsed = ";".join(f"{f.f_code.co_filename}:{f.f_code.co_name}" for f in reversed(stack))
+                        with self._lock:
+                            self.stacks[key][collapsed] += 1
+                        break
+                    frame = frame.f_back
+            time.sleep(interval)
+
+    def report(self, key) -> str:
+        # Brendan Gregg's collapsed format, one "frame;frame;frame count" line per stack
+        with self._lock:
+            stacks = self.stacks.get(key, Counter())
+            return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def status(self, key) -> dict:
+        with self._lock:
+            return {
+                "remaining": self.armed.get(key, 0),
+                "profiled": self.profiled.get(key, 0),
+                "samples": sum(self.stacks.get(key, Counter()).values())
+            }
+
+profiler = Profiler()
@@ -0,0 +1,32 @@
+import re
+from sqlalchemy import event
+
+class QueryPlanRecorder():
+
+    def __init__(self, *engines) -> None:
+        self.engines = [getattr(i, "sync_engine", i) for i in engines]
+        self.statements = {}
+
+    def __enter__(self):
+        for engine in self.engines:
+            event.listen(engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *args) -> None:
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")) and not executemany:
+            self.statements.setdefault(statement, parameters)
+
+    def full_scans(self, connection):
+        # A page read without WHERE stops at its LIMIT, so that scan is bounded
+        scans = []
+        for statement, parameters in self.statements.items():
+            bounded = re.search(r"\bLIMIT\b", statement) and not re.search(r"\bWHERE\b", statement)
+            plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            for row in plan:
+                if re.match(r"SCAN (TABLE )?\w+$", row[-1]) and not bounded:
+                    scans.append((statement, row[-1]))
+        return scans
@@ -0,0 +1,114 @@
+import logging
+import os
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+from threading import Lock
+from sqlalchemy import event
+from config.dabatase import Base
+
+logger = logging.getLogger(__name__)
+
+# Identical statements run this many times in one request are reported as N+1
+n_plus_one_threshold = int(os.getenv("N_PLUS_ONE_THRESHOLD", 5))
+
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class RequestStats():
+
+    def __init__(self) -> None:
+        self.db_time = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.statement_counts = Counter()
+
+    def repeated_statements(self) -> list:
+        return [(s, n) for s, n in self.statement_counts.items() if n >= n_plus_one_threshold]
+
+# Set by the instrumentation middleware, sync routes see it through the threadpool's context copy
+current_request: ContextVar = ContextVar("current_request", default=None)
+
+class RouteMetrics():
+
+    def __init__(self) -> None:
+        self.routes = {}
+        self.requests = Counter()
+        self._lock = Lock()
+
+    def record(self, method: str, route: str, status: int, latency: float, stats: RequestStats) -> None:
+        with self._lock:
+            self.requests[(method, route, status)] += 1
+            metrics = self.routes.get((method, route))
+            if metrics is None:
+                metrics = self.routes[(method, route)] = {
+                    "buckets": [0] * len(latency_buckets), "count": 0, "latency": 0.0,
+                    "db_time": 0.0, "statements": 0, "rows": 0, "n_plus_one": 0
+                }
+            position = bisect_left(latency_buckets, latency)
+            if position < len(latency_buckets):
+                metrics["buckets"][position] += 1
+            metrics["count"] += 1
+            metrics["latency"] += latency
+            metrics["db_time"] += stats.db_time
+            metrics["statements"] += stats.statements
+            metrics["rows"] += stats.rows
+            if stats.repeated_statements():
+                metrics["n_plus_one"] += 1
+
+    def prometheus(self) -> str:
+        with self._lock:
+            lines = ["# TYPE http_requests_total counter"]
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+            lines.append("# TYPE http_request_duration_seconds histogram")
+            for (method, route), metrics in sorted(self.routes.items()):
+                labels = f'method="{method}",route="{route}"'
+                cumulative = 0
+                for bound, count in zip(latency_buckets, metrics["buckets"]):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {metrics["count"]}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {metrics["latency"]}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {metrics["count"]}')
+            for name, key, kind in [
+                    ("db_time_seconds_total", "db_time", "counter"),
+                    ("db_statements_total", "statements", "counter"),
+                    ("db_rows_total", "rows", "counter"),
+                    ("n_plus_one_requests_total", "n_plus_one", "counter")]:
+                lines.append(f"# TYPE {name} {kind}")
+                for (method, route), metrics in sorted(self.routes.items()):
+                    lines.append(f'{name}{{method="{method}",route="{route}"}} {metrics[key]}')
+            return "\n".join(lines) + "\n"
+
+route_metrics = RouteMetrics()
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_request.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_request.get()
+    if stats is None or not conn.info.get("query_start"):
+        return
+    stats.db_time += time.perf_counter() - conn.info["query_start"].pop()
+    stats.statements += 1
+    stats.statement_counts[statement] += 1
+    # SELECT rows are counted as ORM objects load, sqlite reports no rowcount for them
+    if cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+
+def count_loaded_row(target, context):
+    stats = current_request.get()
+    if stats is not None:
+        stats.rows += 1
+
+def instrument(*engines) -> None:
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(Base, "load", count_loaded_row, propagate=True)
+
+def report_repeated_statements(method: str, route: str, stats: RequestStats) -> None:
+    for statement, count in stats.repeated_statements():
+        logger.warning("Possible N+1 on %s %s: %d runs of %s", method, route, count, " ".join(statement.split()))
@@ -0,0 +1,63 @@
+import json
+import re
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.engine import Row
+from config.dabatase import Base
+
+# Columns in table order per model, minus its hidden_columns. jsonable_encoder took the keys from the instance
+# __dict__, whose order changes with the hash seed from one process to the next.
+# Filled on first use, mappers can only be inspected once every model is imported.
+model_fields = {}
+
+# orjson writes floats below 1e-4 and from 1e16 up differently than Python's repr
+float_mismatch = re.compile(rb"\de|0\.0000")
+
+def fields(model) -> tuple:
+    keys = model_fields.get(model)
+    if keys is None:
+        hidden = getattr(model, "hidden_columns", ())
+        keys = model_fields[model] = tuple(i.key for i in inspect(model).column_attrs if i.key not in hidden)
+    return keys
+
+def to_dict(obj) -> dict:
+    if isinstance(obj, Base):
+        # KeyError for an unloaded column, that body takes the stdlib path
+        state = obj.__dict__
+        return {k: state[k] for k in fields(type(obj))}
+    if isinstance(obj, BaseModel):
+        return obj.dict(by_alias=True)
+    if isinstance(obj, Row):
+        return obj._asdict()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def loaded_columns(obj) -> dict:
+    state = obj.__dict__
+    return jsonable_encoder({k: state[k] for k in fields(type(obj)) if k in state})
+
+def stdlib_dumps(content) -> bytes:
+    # Same bytes JSONResponse.render produces for the same content
+    return json.dumps(
+        jsonable_encoder(content, custom_encoder={Base: loaded_columns, Row: lambda row: jsonable_encoder(row._asdict())}),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+def dumps(content) -> bytes:
+    try:
+        body = orjson.dumps(content, default=to_dict)
+    except TypeError:
+        return stdlib_dumps(content)
+    if float_mismatch.search(body):
+        return stdlib_dumps(content)
+    return body
+
+class FastJSONResponse(JSONResponse):
+
+    def render(self, content) -> bytes:
+        return dumps(content)